@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Dynamical classification of minor bodies.
+
+Classes are defined in rule tables (RULES, RULES_DETAILED) as ranges of
+a, q, Q, e and i. Each object gets a uint8 class code (the index of the
+first matching rule, len(rules) for others), so that colors are looked
+up through a colormap and numbers are counted with np.bincount instead
+of boolean masks and object arrays of color names. Histograms of all
+classes are counted at once in the same way (histogram_classes).
+"""
+import time
+import numpy as np
+
+
+def _below(x):
+    """Return the largest float below x for exclusive upper limits."""
+    return float(np.nextafter(x, -np.inf))
+
+
+## Rules of classes in the order of priority, i.e., (name, label, color,
+## ranges), where ranges maps a, q, Q (au), e or i (deg) to (min, max).
+## Both limits are inclusive and None means no limit. Unbound orbits
+## (e >= 1, a < 0) are others whatever the rules are.
+RULES = (
+    ("NEA", "NEA (q<1.3)", "red",
+     {"q": (None, _below(1.3))}),
+    ("MBA", "MBA (q>=1.3, a=1.8–3.3)", "green",
+     {"a": (1.8, 3.3)}),
+    ("Hilda", "Hilda (q$\\geq$1.3, a=3.7-4.0, e=0.07-0.30)", "orange",
+     {"a": (3.7, 4.0), "e": (0.07, 0.3)}),
+    ("Trojan", "Trojan (q$\\geq$1.3, a=5.0-5.4)", "blue",
+     {"a": (5.0, 5.4)}),
+    ("TNO", "TNO (q$\\geq$1.3, a$\\geq$30.0)", "skyblue",
+     {"a": (30.0, None)}),
+    )
+## Rules with NEA subclasses, Hungarias and Centaurs
+RULES_DETAILED = (
+    ("Atira", "Atira (a<1.0, Q<0.983)", "darkred",
+     {"a": (None, _below(1.0)), "Q": (None, _below(0.983))}),
+    ("Aten", "Aten (a<1.0, Q$\\geq$0.983)", "red",
+     {"a": (None, _below(1.0))}),
+    ("Apollo", "Apollo (a$\\geq$1.0, q$\\leq$1.017)", "orangered",
+     {"q": (None, 1.017)}),
+    ("Amor", "Amor (1.017<q<1.3)", "salmon",
+     {"q": (None, _below(1.3))}),
+    ("Hungaria", "Hungaria (a=1.78-2.0, e<0.18, i=16-34)", "purple",
+     {"a": (1.78, 2.0), "e": (None, _below(0.18)), "i": (16., 34.)}),
+    ("MBA", "MBA (a=1.8–3.3)", "green",
+     {"a": (1.8, 3.3)}),
+    ("Hilda", "Hilda (a=3.7-4.0, e=0.07-0.30)", "orange",
+     {"a": (3.7, 4.0), "e": (0.07, 0.3)}),
+    ("Trojan", "Trojan (a=5.0-5.4)", "blue",
+     {"a": (5.0, 5.4)}),
+    ("Centaur", "Centaur (a=5.5-30.1)", "olive",
+     {"a": (5.5, 30.1)}),
+    ("TNO", "TNO (a>30.1)", "skyblue",
+     {"a": (np.nextafter(30.1, np.inf), None)}),
+    )
+## Rule tables by name
+TAXONOMIES = {"default": RULES, "detailed": RULES_DETAILED}
+## Name, label and color of objects matching no rule
+OTHERS = ("Others", "Others", "gray")
+
+## Names, labels and colors of the default classes (class code is the index)
+CLASSES = tuple(rule[0] for rule in RULES) + (OTHERS[0],)
+CLASS_LABELS = tuple(rule[1] for rule in RULES) + (OTHERS[1],)
+CLASS_COLORS = tuple(rule[2] for rule in RULES) + (OTHERS[2],)
+
+## Number of objects evaluated at once (fits in the CPU cache)
+CHUNK = 2**16
+## Semimajor axis of Jupiter in au for the Tisserand parameter
+A_JUPITER = 5.2026
+
+
+def class_names(rules=RULES):
+    """Return names of classes including others.
+
+    Parameter
+    ---------
+    rules : tuple, optional
+        rule table
+
+    Return
+    ------
+    names : tuple of str
+        names of classes (class code is the index)
+    """
+    return tuple(rule[0] for rule in rules) + (OTHERS[0],)
+
+
+def compile_rules(rules=RULES):
+    """Compile a rule table into conditions.
+
+    Parameter
+    ---------
+    rules : tuple, optional
+        rule table
+
+    Returns
+    -------
+    conds : list of list
+        (key, min, max) of each rule, without unlimited sides
+    keys : set of str
+        quantities used in the rules
+    """
+    if len(rules) >= 255:
+        raise ValueError("Too many rules for uint8 class codes.")
+    conds, keys = [], set()
+    for name, _, _, ranges in rules:
+        cond = []
+        for key, (vmin, vmax) in ranges.items():
+            if key not in ("a", "q", "Q", "e", "i"):
+                raise ValueError(f"Unknown quantity {key} in rule {name}")
+            cond.append((key, vmin, vmax))
+            keys.add(key)
+        conds.append(cond)
+    return conds, keys
+
+
+def classify(a, e, i=None, rules=RULES, return_stats=False):
+    """Classify minor bodies by orbital elements.
+
+    All rules are evaluated chunk by chunk, i.e., in a single pass over
+    the arrays. The rules are applied in the reverse order of priority
+    so that the first matching rule wins. Unbound orbits (e >= 1) are
+    others, since their negative a and Q would pass upper limits.
+
+    Parameters
+    ----------
+    a : array-like
+        semimajor axis in au
+    e : array-like
+        eccentricity
+    i : array-like, optional
+        inclination in deg (necessary if used in rules)
+    rules : tuple, optional
+        rule table (see RULES)
+    return_stats : bool, optional
+        return counts by name and elapsed time as well
+
+    Returns
+    -------
+    code : numpy.ndarray
+        uint8 class codes (index in class_names(rules))
+    counts : numpy.ndarray
+        number of objects in each class
+    stats : dict
+        counts by name and t_elapse in s, only if return_stats is True
+    """
+    t0 = time.perf_counter()
+    conds, keys = compile_rules(rules)
+    a = np.asarray(a, dtype=np.float64)
+    e = np.asarray(e, dtype=np.float64)
+    if "i" in keys:
+        if i is None:
+            raise ValueError("Inclination is necessary for the rules.")
+        i = np.asarray(i, dtype=np.float64)
+
+    N = len(a)
+    code = np.full(N, len(rules), dtype=np.uint8)
+    for idx0 in range(0, N, CHUNK):
+        sl = slice(idx0, idx0 + CHUNK)
+        val = dict(a=a[sl], e=e[sl])
+        if "q" in keys:
+            val["q"] = val["a"]*(1 - val["e"])
+        if "Q" in keys:
+            val["Q"] = val["a"]*(1 + val["e"])
+        if "i" in keys:
+            val["i"] = i[sl]
+
+        code_chunk = code[sl]
+        for n in range(len(rules) - 1, -1, -1):
+            mask = np.ones(len(code_chunk), dtype=bool)
+            for key, vmin, vmax in conds[n]:
+                if vmin is not None:
+                    mask &= (val[key] >= vmin)
+                if vmax is not None:
+                    mask &= (val[key] <= vmax)
+            code_chunk[mask] = n
+        code_chunk[val["e"] >= 1] = len(rules)
+
+    counts = np.bincount(code, minlength=len(rules) + 1)
+    if not return_stats:
+        return code, counts
+    stats = dict(
+        counts=dict(zip(class_names(rules), counts.tolist())),
+        t_elapse=time.perf_counter() - t0)
+    return code, counts, stats
+
+
+def tisserand(a, e, i, a_p=A_JUPITER):
+    """Calculate the Tisserand parameter with respect to a planet.
+
+    Parameters
+    ----------
+    a : array-like
+        semimajor axis in au
+    e : array-like
+        eccentricity
+    i : array-like
+        inclination in deg
+    a_p : float, optional
+        semimajor axis of the planet in au (Jupiter by default)
+
+    Return
+    ------
+    T : numpy.ndarray
+        Tisserand parameter
+    """
+    a = np.asarray(a, dtype=np.float64)
+    e = np.asarray(e, dtype=np.float64)
+    i = np.deg2rad(np.asarray(i, dtype=np.float64))
+    T = a_p/a + 2*np.cos(i)*np.sqrt(a/a_p*(1 - e**2))
+    return T
+
+
+def bin_index(x, edges):
+    """Calculate bin indices of values as in np.histogram.
+
+    Bins are half-open except for the last one, which includes the upper
+    edge. Values out of range (or NaN) get -1.
+
+    Parameters
+    ----------
+    x : array-like
+        values
+    edges : numpy.ndarray
+        monotonically increasing bin edges
+
+    Return
+    ------
+    idx : numpy.ndarray
+        int64 bin indices
+    """
+    x = np.asarray(x, dtype=np.float64)
+    idx = np.searchsorted(edges, x, side="right") - 1
+    idx[x == edges[-1]] = len(edges) - 2
+    idx[(idx < 0) | (idx >= len(edges) - 1) | np.isnan(x)] = -1
+    return idx
+
+
+def histogram_classes(code, idx, Nbin, rules=RULES, hist=None):
+    """Accumulate histograms of each class from bin indices.
+
+    All classes are counted at once with np.bincount on code*Nbin + idx,
+    so that histograms can be accumulated chunk by chunk.
+
+    Parameters
+    ----------
+    code : numpy.ndarray
+        class codes from classify
+    idx : numpy.ndarray
+        bin indices from bin_index (-1 is not counted)
+    Nbin : int
+        number of bins
+    rules : tuple, optional
+        rule table used in classify
+    hist : numpy.ndarray, optional
+        histograms to be added to
+
+    Return
+    ------
+    hist : numpy.ndarray
+        int64 histograms with shape (number of classes, Nbin)
+    """
+    N_cls = len(rules) + 1
+    if hist is None:
+        hist = np.zeros((N_cls, Nbin), dtype=np.int64)
+    valid = idx >= 0
+    key = code[valid].astype(np.int64)*Nbin + idx[valid]
+    hist += np.bincount(key, minlength=N_cls*Nbin).reshape(N_cls, Nbin)
+    return hist
+
+
+def class_cmap(rules=RULES):
+    """Make a colormap of classes.
+
+    Parameter
+    ---------
+    rules : tuple, optional
+        rule table
+
+    Return
+    ------
+    cmap : matplotlib.colors.ListedColormap
+        colormap whose n-th color is that of the class code n
+    """
+    from matplotlib.colors import ListedColormap
+    return ListedColormap([rule[2] for rule in rules] + [OTHERS[2]])
+
+
+def scatter_classes(
+        ax, x, y, code, counts, rules=RULES, skip_empty=False, **kwargs):
+    """Plot minor bodies colored by class with a legend of numbers.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        axis
+    x, y : array-like
+        coordinates
+    code : numpy.ndarray
+        class codes from classify
+    counts : numpy.ndarray
+        numbers of objects from classify
+    rules : tuple, optional
+        rule table used in classify
+    skip_empty : bool, optional
+        do not show empty classes in the legend
+    kwargs : dict, optional
+        passed to ax.scatter
+    """
+    ax.scatter(
+        x, y, c=code, cmap=class_cmap(rules), vmin=-0.5,
+        vmax=len(rules) + 0.5, label='_nolegend_', **kwargs)
+    legend_classes(ax, counts, rules=rules, skip_empty=skip_empty)
+
+
+def density_classes(
+        ax, x, y, code, counts, extent, rules=RULES, alpha=0.9,
+        skip_empty=False):
+    """Plot minor bodies as a density image colored by class.
+
+    Points are binned per class into pixels of the axis (np.bincount on
+    pixel indices), and the classes are composited as colored layers
+    (composite_classes), so that the rendering time does not depend on
+    the number of objects.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        axis
+    x, y : array-like
+        coordinates
+    code : numpy.ndarray
+        class codes from classify
+    counts : numpy.ndarray
+        numbers of objects from classify
+    extent : tuple
+        (xmin, xmax, ymin, ymax) of the image
+    rules : tuple, optional
+        rule table used in classify
+    alpha : float, optional
+        opacity of a single object
+    skip_empty : bool, optional
+        do not show empty classes in the legend
+    """
+    # Pixels of the axis in the figure
+    bbox = ax.get_window_extent()
+    W, H = max(int(bbox.width), 1), max(int(bbox.height), 1)
+    xmin, xmax, ymin, ymax = extent
+    ix = np.floor((np.asarray(x) - xmin)/(xmax - xmin)*W).astype(np.int64)
+    iy = np.floor((np.asarray(y) - ymin)/(ymax - ymin)*H).astype(np.int64)
+    inside = (ix >= 0) & (ix < W) & (iy >= 0) & (iy < H)
+    pix = (code[inside].astype(np.int64)*H + iy[inside])*W + ix[inside]
+    N_cls = len(rules) + 1
+    hist = np.bincount(pix, minlength=N_cls*H*W).reshape(N_cls, H, W)
+
+    img = composite_classes(hist, counts, rules=rules, alpha=alpha)
+    ax.imshow(
+        img, extent=extent, origin="lower", interpolation="nearest",
+        aspect="auto")
+    legend_classes(ax, counts, rules=rules, skip_empty=skip_empty)
+
+
+def composite_classes(hist, counts, rules=RULES, alpha=0.9):
+    """Composite histograms of classes into an RGBA image.
+
+    The opacity of a bin with n objects is that of n overlapping points
+    with the opacity alpha. Classes of higher priority are on top.
+
+    Parameters
+    ----------
+    hist : numpy.ndarray
+        histograms with shape (number of classes, H, W)
+    counts : numpy.ndarray
+        numbers of objects from classify (empty classes are skipped)
+    rules : tuple, optional
+        rule table used in classify
+    alpha : float, optional
+        opacity of a single object
+
+    Return
+    ------
+    img : numpy.ndarray
+        RGBA image with shape (H, W, 4)
+    """
+    from matplotlib.colors import to_rgb
+
+    N_cls, H, W = hist.shape
+    # Composite from the lowest priority (others) to the highest
+    colors = [rule[2] for rule in rules] + [OTHERS[2]]
+    img = np.zeros((H, W, 4))
+    for n in range(N_cls - 1, -1, -1):
+        if counts[n] == 0:
+            continue
+        a = 1 - (1 - alpha)**hist[n]
+        img[..., :3] = (
+            np.array(to_rgb(colors[n]))*a[..., None]
+            + img[..., :3]*(1 - a[..., None]))
+        img[..., 3] = a + img[..., 3]*(1 - a)
+    # Colors were accumulated premultiplied by alpha
+    mask = img[..., 3] > 0
+    img[mask, :3] /= img[mask, 3][:, None]
+    return img
+
+
+def legend_classes(ax, counts, rules=RULES, skip_empty=False):
+    """Add dummy points to show classes with numbers in the legend.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        axis
+    counts : numpy.ndarray
+        numbers of objects from classify
+    rules : tuple, optional
+        rule table used in classify
+    skip_empty : bool, optional
+        do not show empty classes
+    """
+    labels = [rule[1] for rule in rules] + [OTHERS[1]]
+    colors = [rule[2] for rule in rules] + [OTHERS[2]]
+    for label, color, N in zip(labels, colors, counts):
+        if skip_empty and N == 0:
+            continue
+        ax.scatter([], [], color=color, label=f"{label}: N={N}", s=20)
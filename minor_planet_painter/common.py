@@ -3,8 +3,6 @@
 import os
 import numpy as np
 from datetime import datetime, timedelta
-from astropy.time import Time
-from astroquery.jplhorizons import Horizons
 
 ## Path to common.py
 BASE = os.path.dirname(os.path.abspath(__file__))
@@ -12,6 +10,8 @@ BASE = os.path.dirname(os.path.abspath(__file__))
 DATA = os.path.normpath(os.path.join(BASE, "../data"))
 ## Path to MPCORB
 MPCORB = os.path.normpath(os.path.join(DATA, "MPCORB.DAT"))
+## Path to CACHE
+CACHE = os.path.normpath(os.path.join(DATA, "cache"))
 
 mycolor = [
     # red
@@ -23,55 +23,187 @@ mycolor = [
     ]
 
 
-def jd2utc(jd):
-    """Convert jd to utc in '%Y-%m-%dT%H:%M:%S.%f'.
+## Julian day of the unix epoch (1970-01-01T00:00:00)
+JD_UNIX = 2440587.5
+_UNIX = np.datetime64("1970-01-01T00:00:00", "us")
+_US_PER_DAY = 86400*10**6
+
+
+def _isot2jd(t):
+    """Convert ISO strings in a fixed form to jd.
+
+    All strings should have the same length and the form of
+    'YYYY-MM-DD', 'YYYY-MM-DDTHH:MM', 'YYYY-MM-DDTHH:MM:SS' or
+    'YYYY-MM-DDTHH:MM:SS.f...'. The digits are read at fixed positions
+    and converted with the integer algorithm in date2jd.
+
+    Parameter
+    ---------
+    t : numpy.ndarray
+        str array of time in utc
+
+    Return
+    ------
+    t_jd : numpy.ndarray or None
+        julian day, None if any string is not in the form
+    """
+    width = t.dtype.itemsize//4
+    if t.size == 0 or width < 10:
+        return None
+    chars = np.ascontiguousarray(t.ravel()).view(np.uint32).reshape(-1, width)
+    L = np.count_nonzero(chars[0])
+    # Lengths of all strings should be L
+    if np.any(chars[:, L - 1] == 0) or (L < width and np.any(chars[:, L] != 0)):
+        return None
+    if (L not in (10, 16) and L < 19) or L == 20:
+        return None
+    chars = chars[:, :L]
+    if np.any(chars > 127):
+        return None
+    # Characters of each position are made contiguous
+    chars = np.ascontiguousarray(chars.astype(np.uint8).T)
+
+    # Separators and digits
+    sep = {4: "-", 7: "-", 10: "T", 13: ":", 16: ":", 19: "."}
+    for idx, c in sep.items():
+        if idx < L and np.any(chars[idx] != ord(c)):
+            return None
+    # Non-digits become larger than 9 as uint8
+    digit = chars - np.uint8(ord("0"))
+    for idx in range(L):
+        if idx not in sep and np.any(digit[idx] > 9):
+            return None
+
+    def num(idx0, idx1):
+        val = np.zeros(chars.shape[1], dtype=np.int64)
+        for idx in range(idx0, idx1):
+            val = val*10 + digit[idx]
+        return val
+
+    zero = np.zeros(chars.shape[1], dtype=np.int64)
+    year, month, day = num(0, 4), num(5, 7), num(8, 10)
+    hour = num(11, 13) if L > 10 else zero
+    minute = num(14, 16) if L > 10 else zero
+    second = num(17, 19) if L > 16 else zero
+    frac = num(20, L)/10.0**(L - 20) if L > 20 else 0.
+    if (np.any((month < 1) | (month > 12) | (day < 1) | (day > 31))
+            or np.any((hour > 23) | (minute > 59) | (second > 60))):
+        return None
+
+    sec = hour*3600 + minute*60 + second + frac
+    t_jd = date2jd(year, month, day + sec/86400.)
+    return t_jd.reshape(t.shape)
+
+
+def jd2utc(jd, exact=False):
+    """Convert jd to utc.
+
+    Leap seconds are ignored unless exact=True, which uses astropy.Time.
 
     Parameter
     ---------
-    jd : float
+    jd : float or array-like
         julian day
+    exact : bool, optional
+        convert with astropy.Time taking leap seconds into account
 
     Return
     ------
-    t_utc : str
-        time in utc
+    t_utc : datetime.datetime or numpy.ndarray
+        time in utc (datetime64[us] array for array input)
     """
-    t = Time(str(jd), format='jd', scale='utc')
-    t_utc = t.datetime
+    if exact:
+        from astropy.time import Time
+        t = Time(jd, format='jd', scale='utc')
+        t_utc = t.datetime
+        return t_utc
+
+    jd = np.asarray(jd, dtype=np.float64)
+    us = np.round((jd - JD_UNIX)*_US_PER_DAY).astype(np.int64)
+    t_utc = _UNIX + us.astype("timedelta64[us]")
+    if t_utc.ndim == 0:
+        t_utc = t_utc.item()
     return t_utc
 
 
-def utc2jd(utc):
-    """Convert utc to jd in '%Y-%m-%dT%H:%M:%S.%f'.
+def utc2jd(utc, exact=False):
+    """Convert utc to jd.
+
+    Strings in ISO format ('%Y-%m-%dT%H:%M:%S.%f' or '%Y-%m-%d'),
+    datetime and datetime64 are accepted. Floats and integers are regarded
+    as jd and returned as floats. The proleptic Gregorian calendar of datetime64 is
+    used and leap seconds are ignored unless exact=True, which uses
+    astropy.Time.
 
     Parameter
     ---------
-    utc : str
-        time in utc
+    utc : str, datetime.datetime, float, int or array-like
+        time in utc (or jd if float or int)
+    exact : bool, optional
+        convert with astropy.Time taking leap seconds into account
 
     Return
     ------
-    t_jd : float
+    t_jd : float or numpy.ndarray
         julian day
     """
-    t = Time(str(utc), format='isot', scale='utc')
-    t_jd = t.jd
+    if isinstance(utc, (float, int, np.floating, np.integer)):
+        return float(utc)
+    t = np.asarray(utc)
+    if t.dtype.kind == "f":
+        return t
+    if t.dtype.kind in "iu":
+        return t.astype(np.float64)
+
+    if t.dtype.kind == "U":
+        t = np.char.strip(t)
+        if not exact:
+            t_jd = _isot2jd(t)
+            if t_jd is not None:
+                if t_jd.ndim == 0:
+                    t_jd = float(t_jd)
+                return t_jd
+    t = t.astype("datetime64[us]")
+
+    if exact:
+        from astropy.time import Time
+        t = Time(np.datetime_as_string(t), format='isot', scale='utc')
+        t_jd = t.jd
+        return t_jd
+
+    t_jd = JD_UNIX + (t - _UNIX).astype(np.int64)/_US_PER_DAY
+    if t_jd.ndim == 0:
+        t_jd = float(t_jd)
     return t_jd
 
 
-def get_planet_positions(t_utc):
+def get_planet_positions(t_utc, source="horizons", cache=True, pin=False):
     """Get positions of planets.
 
-    Parameter
-    ---------
+    Parameters
+    ----------
     t_utc : str
         time in utc
+    source : str, optional
+        'horizons' (barycentric positions from JPL Horizons) or
+        'kepler' (heliocentric positions from mean orbital elements
+        computed offline, see planets.py)
+    cache : bool, optional
+        use the cache of Horizons queries (see horizons.py)
+    pin : bool, optional
+        keep the cached queries from eviction (see horizons.py)
 
     Return
     ------
     positions : dict
         positions of planets
     """
+    if source == "kepler":
+        from .planets import planet_positions
+        return planet_positions(utc2jd(t_utc))
+    elif source != "horizons":
+        raise ValueError(f"Unknown source: {source}")
+
     planets = {
         "Mercury": 1,
         "Venus": 2,
@@ -83,11 +215,14 @@ def get_planet_positions(t_utc):
         "Neptune": 8,
         "Pluto": 9
     }
+    from .horizons import query_vectors_many
+
     positions = {}
     jd = utc2jd(t_utc)
-    for name, pid in planets.items():
-        obj = Horizons(id=pid, location="@0", epochs=jd)
-        vec = obj.vectors()
+    vecs = query_vectors_many(
+        [(pid, "@0", jd) for pid in planets.values()],
+        workers=len(planets), cache=cache, pin=pin)
+    for name, vec in zip(planets, vecs):
         x = float(vec['x'][0])
         y = float(vec['y'][0])
         z = float(vec['z'][0])
@@ -95,19 +230,28 @@ def get_planet_positions(t_utc):
     return positions
 
 
-def get_planet_orbits(t_utc):
+def get_planet_orbits(t_utc, source="horizons", cache=True, pin=False):
     """Get orbits of planets.
 
-    Parameter
-    ---------
+    Parameters
+    ----------
     t_utc : str
         time in utc
+    source : str, optional
+        'horizons' (JPL Horizons) or 'kepler' (mean orbital elements
+        computed offline, see planets.py)
+    cache : bool, optional
+        use the cache of Horizons queries (see horizons.py)
+    pin : bool, optional
+        keep the cached queries from eviction (see horizons.py)
 
     Return
     ------
     orbits : dict
         orbits of planets
     """
+    if source not in ("horizons", "kepler"):
+        raise ValueError(f"Unknown source: {source}")
 
     # To datetime
     t_utc = datetime.fromisoformat(t_utc)
@@ -123,17 +267,35 @@ def get_planet_orbits(t_utc):
         "Neptune":  {"id": 8, "days": 60000,   "step": "100d"},
         "Pluto":    {"id": 9, "days": 90000,   "step": "150d"},
     }
-    orbits = {}
+    if source == "kepler":
+        from .planets import planet_positions
+        jd = utc2jd(t_utc)
+        orbits = {}
+        for name, params in planet_params.items():
+            step = float(params["step"].rstrip("d"))
+            half = params["days"]/2
+            jds = jd + np.arange(-half, half + step, step)
+            ox, oy, _ = planet_positions(jds, names=[name])[name]
+            orbits[name] = (ox, oy)
+        return orbits
+
+    from .horizons import query_vectors_many
+
+    queries = []
     for name, params in planet_params.items():
         start_date = (t_utc - timedelta(days=params["days"]/2)).strftime("%Y-%m-%d")
         stop_date = (t_utc + timedelta(days=params["days"]/2)).strftime("%Y-%m-%d")
-
-        obj = Horizons(id=params["id"], location="@0", epochs={
+        queries.append((params["id"], "@0", {
             'start': start_date,
             'stop': stop_date,
             'step': params["step"]
-        })
-        vec = obj.vectors()
+        }))
+
+    # Sent concurrently, all planets take about as long as the slowest one
+    orbits = {}
+    vecs = query_vectors_many(
+        queries, workers=len(queries), cache=cache, pin=pin)
+    for name, vec in zip(planet_params, vecs):
         x = np.array(vec['x'], dtype=float)
         y = np.array(vec['y'], dtype=float)
         orbits[name] = (x, y)
@@ -141,27 +303,76 @@ def get_planet_orbits(t_utc):
     return orbits
 
 
-def solve_kepler_eq(M, e, max_iter=10):
+def solve_kepler_eq(M, e, max_iter=50, *, tol=1e-12, return_stats=False):
     """Solve Kepler equation.
 
     See
     https://en.wikipedia.org/wiki/Kepler%27s_equation
 
+    Newton iterations start from E = M + e*sin(M) (E = M + 0.85*e for
+    e > 0.8, Danby 1987) and are applied only to elements not yet
+    converged to |dE| < tol.
+
     Parameters
     ----------
-    M : float
+    M : float or array-like
         mean anomaly
-    e : float
-        eccentricity
+    e : float or array-like
+        eccentricity (< 1)
+    max_iter : int, optional
+        maximum number of iterations
+    tol : float, optional
+        tolerance of eccentric anomaly in rad (keyword only)
+    return_stats : bool, optional
+        return statistics of iterations as well (keyword only)
 
     Return
     ------
-    E : float
+    E : float or numpy.ndarray
         eccentric anomaly
+    stats : dict
+        N (number of elements), N_iter (number of iterations),
+        N_eval (number of element updates), N_unconverged and
+        hist_iter (number of elements converged at each iteration),
+        only if return_stats is True
     """
-    E = M.copy()
-    for _ in range(max_iter):
-        E = E - (E - e*np.sin(E) - M) / (1 - e*np.cos(E))
+    M = np.asarray(M, dtype=np.float64)
+    e = np.asarray(e, dtype=np.float64)
+    M, e = np.broadcast_arrays(M, e)
+    shape = M.shape
+    M = M.ravel()
+    e = e.ravel()
+
+    # Solve for M in [-pi, pi) and restore the revolutions at the end
+    M_red = np.mod(M + np.pi, 2*np.pi) - np.pi
+    E = M_red + e*np.sin(M_red)
+    high = e > 0.8
+    E[high] = M_red[high] + 0.85*e[high]*np.sign(M_red[high])
+
+    # Indices of elements not yet converged
+    idx = np.arange(len(M))
+    hist_iter = [0]
+    N_eval = 0
+    N_iter = 0
+    while len(idx) > 0 and N_iter < max_iter:
+        E_a, e_a = E[idx], e[idx]
+        dE = (E_a - e_a*np.sin(E_a) - M_red[idx]) / (1 - e_a*np.cos(E_a))
+        E[idx] = E_a - dE
+        N_eval += len(idx)
+        N_iter += 1
+        # NaN is dropped as well
+        active = np.abs(dE) > tol
+        hist_iter.append(len(idx) - np.count_nonzero(active))
+        idx = idx[active]
+
+    E = (E + (M - M_red)).reshape(shape)
+    if E.ndim == 0:
+        E = float(E)
+    if return_stats:
+        stats = dict(
+            N=len(M), N_iter=N_iter, N_eval=N_eval, N_unconverged=len(idx),
+            hist_iter=np.array(hist_iter))
+        return E, stats
     return E
 
 
@@ -228,15 +439,116 @@ def mpcepoch2jd(epoch_code):
     yy = int(integer_part[1:3])
     year = century + yy
 
-    day_of_year_int = base36_to_int(integer_part[3:5])
-    day_of_year = day_of_year_int + float('0.' + fractional_part)
+    # Month (1-9, A-C) and day (1-9, A-V)
+    month = base36_to_int(integer_part[3])
+    day = base36_to_int(integer_part[4])
+    day_frac = float('0.' + fractional_part)
 
-    date = datetime(year, 1, 1) + timedelta(days=day_of_year - 1)
+    date = datetime(year, month, day) + timedelta(days=day_frac)
     date = date.isoformat()
     date_jd = utc2jd(date)
     return date_jd
 
 
+def date2jd(year, month, day):
+    """Convert Gregorian calendar dates to jd.
+
+    The integer algorithm of Fliegel & Van Flandern (1968) is used.
+
+    Parameters
+    ----------
+    year, month : int or array-like
+        year and month
+    day : float or array-like
+        day of month including the fraction of day
+
+    Return
+    ------
+    jd : float or numpy.ndarray
+        julian day
+    """
+    year = np.asarray(year, dtype=np.int64)
+    month = np.asarray(month, dtype=np.int64)
+    day = np.asarray(day, dtype=np.float64)
+    day_int = np.floor(day).astype(np.int64)
+
+    a = (14 - month)//12
+    y = year + 4800 - a
+    m = month + 12*a - 3
+    jdn = (day_int + (153*m + 2)//5 + 365*y + y//4 - y//100 + y//400 - 32045)
+    jd = jdn - 0.5 + (day - day_int)
+    return jd
+
+
+## Values of characters in packed dates (-1 for invalid characters)
+_PACKED_VALUE = np.full(128, -1, dtype=np.int64)
+_PACKED_VALUE[ord('0'):ord('9') + 1] = np.arange(10)
+_PACKED_VALUE[ord('A'):ord('Z') + 1] = np.arange(10, 36)
+
+
+def mpcepoch2jd_array(epoch_codes):
+    """Convert MPC epochs in packed format to jd for many objects at once.
+
+    MPCORB.DAT has only a few dozen distinct epochs for ~1.4 million
+    objects, so the distinct epochs are decoded by table lookups and the
+    jds are broadcast back to all objects.
+
+    See https://www.minorplanetcenter.net/iau/info/PackedDates.html
+
+    Parameter
+    ---------
+    epoch_codes : array-like
+        MPC epochs in packed format (e.g., 'K2555')
+
+    Return
+    ------
+    epoch_jd : numpy.ndarray
+        epochs in jd
+    """
+    epoch_codes = np.asarray(epoch_codes, dtype=str)
+    if epoch_codes.size == 0:
+        return np.zeros(epoch_codes.shape)
+
+    codes = epoch_codes.ravel()
+    if codes.dtype.itemsize <= 4*5:
+        # Encode up to 5 characters into an integer to find distinct epochs
+        # faster than sorting strings
+        chars = np.ascontiguousarray(codes, dtype="U5")
+        chars = chars.view(np.uint32).reshape(-1, 5).astype(np.int64)
+        key = np.zeros(len(chars), dtype=np.int64)
+        for idx in range(5):
+            key = key*128 + (chars[:, idx] & 127)
+        # Non-ASCII characters are invalid anyway
+        key[np.any(chars > 127, axis=1)] = -1
+        _, idx_u, inverse = np.unique(
+            key, return_index=True, return_inverse=True)
+        codes_u = codes[idx_u]
+    else:
+        codes_u, inverse = np.unique(codes, return_inverse=True)
+    codes_u = np.char.upper(np.char.strip(codes_u))
+
+    chars_u = np.ascontiguousarray(codes_u, dtype="U5")
+    chars_u = chars_u.view(np.uint32).reshape(-1, 5).astype(np.int64)
+    value = _PACKED_VALUE[np.clip(chars_u, 0, 127)]
+    value[chars_u > 127] = -1
+    century = 1800 + 100*(value[:, 0] - 18)
+    year = century + 10*value[:, 1] + value[:, 2]
+    month = value[:, 3]
+    day = value[:, 4]
+
+    valid = (
+        (value[:, 0] >= 18) & (value[:, 1] >= 0) & (value[:, 1] <= 9)
+        & (value[:, 2] >= 0) & (value[:, 2] <= 9)
+        & (month >= 1) & (month <= 12) & (day >= 1) & (day <= 31)
+        & (np.char.str_len(codes_u) == 5))
+    if not np.all(valid):
+        raise ValueError(f"Invalid MPC epoch: {codes_u[~valid][0]}")
+
+    jd_u = date2jd(year, month, day)
+    epoch_jd = jd_u[inverse.ravel()].reshape(epoch_codes.shape)
+    return epoch_jd
+
+
 # Not used.
 def update_mean_anomaly_longterm(M, n, dt_days, step_days=365.25):
     """Alternative to M_t = M + n*dt_days.
@@ -281,3 +593,35 @@ def plot_black(ax, text_color='white'):
         legend.get_frame().set_edgecolor(text_color)
 
 
+def save_figure(out, batch=False):
+    """Show the current figure and save it if wanted.
+
+    In batch mode, the figure is saved without being shown or asking.
+
+    Parameters
+    ----------
+    out : str
+        output filename
+    batch : bool, optional
+        save the figure without the prompt
+    """
+    import matplotlib.pyplot as plt
+
+    if batch:
+        plt.savefig(out)
+        print(f"  Figure is saved as {out}")
+        plt.close()
+        return
+
+    plt.show(block=False)
+    print()
+    ans = input("  Save figure? (y/n): ").strip().lower()
+    if ans != 'y':
+        plt.close()
+    else:
+        try:
+            plt.savefig(out)
+            print(f"  Figure is saved as {out}")
+        except ValueError:
+            print("  Not saved. Exiting.")
+        plt.close()
@@ -0,0 +1,566 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Queries to JPL Horizons with a persistent cache.
+
+Results of vector and ephemeris queries are saved in an SQLite database
+under common.CACHE, keyed on (kind, id, location, epochs), so that
+repeated renders for the same date do not query Horizons again and work
+offline once the cache is seeded (see seed_planets). Several queries can
+be sent at once with query_vectors_many and query_ephemerides, which run
+them in a bounded thread pool. Since every finished query is saved,
+the cache also works as a checkpoint of long runs.
+
+Entries are evicted in the order of last access when the cache exceeds
+MAX_BYTES, except pinned ones, i.e., planets seeded with seed_planets
+and queries of query_ephemerides until the run has finished, so that
+an interrupted run does not lose its own results. The total size of
+evictable entries is kept in the database, so that an insert does not
+scan the table.
+"""
+import io
+import os
+import json
+import time
+import sqlite3
+import numpy as np
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from .common import CACHE
+
+
+## Path to the cache of Horizons queries
+HORIZONS_DB = os.path.join(CACHE, "horizons.sqlite")
+## Time to live of cached queries in s
+TTL = 30*86400.
+## Maximum size of cached data in bytes (pinned entries are not counted)
+MAX_BYTES = 256*2**20
+## Fraction of MAX_BYTES to which the cache is reduced on eviction
+EVICT_TO = 0.9
+
+## Number of concurrent queries
+WORKERS = 4
+## Number of retries of a query failed by a transient error
+RETRIES = 3
+## Wait before the first retry in s (doubled on each retry)
+BACKOFF = 1.0
+
+## Columns saved from vector queries
+VECTOR_COLUMNS = ("datetime_jd", "x", "y", "z", "vx", "vy", "vz")
+## Columns saved from ephemeris queries (rates in arcsec/h)
+EPHEM_COLUMNS = (
+    "datetime_jd", "RA", "DEC", "RA_rate", "DEC_rate", "delta", "r", "V")
+## Number of targets in a batch of query_ephemerides
+BATCH = 100
+## Maximum number of discrete epochs in a query of query_vectors_many
+## (astroquery warns on URIs of 2000 characters or more)
+MAX_EPOCHS = 50
+
+
+@contextmanager
+def _connect(db):
+    """Open the cache database in a transaction, creating it if necessary.
+    """
+    os.makedirs(os.path.dirname(db), exist_ok=True)
+    con = sqlite3.connect(db, timeout=30)
+    try:
+        with con:
+            # Take the write lock first, so that connections opened at the
+            # same time set up the schema one after another
+            con.execute("BEGIN IMMEDIATE")
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS queries ("
+                "key TEXT PRIMARY KEY, created REAL, accessed REAL, "
+                "size INTEGER, data BLOB, pinned INTEGER NOT NULL DEFAULT 0)")
+            cols = [
+                row[1] for row in con.execute("PRAGMA table_info(queries)")]
+            if "pinned" not in cols:
+                # Database of an older version
+                con.execute(
+                    "ALTER TABLE queries "
+                    "ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+            con.execute(
+                "CREATE INDEX IF NOT EXISTS queries_lru "
+                "ON queries (pinned, accessed)")
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS stats ("
+                "name TEXT PRIMARY KEY, value INTEGER)")
+            # Total size of evictable entries
+            con.execute(
+                "INSERT OR IGNORE INTO stats VALUES ('bytes', (SELECT "
+                "COALESCE(SUM(size), 0) FROM queries WHERE pinned = 0))")
+            yield con
+    finally:
+        con.close()
+
+
+def _encode(vec):
+    """Serialize a dict of arrays."""
+    buf = io.BytesIO()
+    np.savez(buf, **vec)
+    return buf.getvalue()
+
+
+def _decode(data):
+    """Deserialize a dict of arrays."""
+    with np.load(io.BytesIO(data)) as f:
+        return {key: f[key] for key in f.files}
+
+
+def cache_key(id, location, epochs, kind="vectors"):
+    """Make a key of a query.
+
+    Parameters
+    ----------
+    id : int or str
+        target id
+    location : str
+        location of the observer
+    epochs : float, list or dict
+        epochs of the query
+    kind : str, optional
+        'vectors' or 'ephemerides'
+
+    Return
+    ------
+    key : str
+        key in json
+    """
+    if isinstance(epochs, np.ndarray):
+        epochs = epochs.tolist()
+    elif isinstance(epochs, np.floating):
+        epochs = float(epochs)
+    key = json.dumps(
+        [kind, str(id), str(location), epochs], sort_keys=True)
+    return key
+
+
+def fetch_vectors(id, location, epochs, retries=None, backoff=None):
+    """Query vectors to Horizons without cache.
+
+    Parameters
+    ----------
+    id : int or str
+        target id
+    location : str
+        location of the observer
+    epochs : float, list or dict
+        epochs of the query
+    retries : int, optional
+        number of retries of a transient failure (RETRIES by default)
+    backoff : float, optional
+        wait before the first retry in s, doubled on each retry
+        (BACKOFF by default)
+
+    Return
+    ------
+    vec : dict
+        arrays of VECTOR_COLUMNS
+    """
+    from astroquery.jplhorizons import Horizons
+
+    obj = Horizons(id=id, location=location, epochs=epochs)
+    # Results are cached in HORIZONS_DB, not by astroquery
+    tab = _retry(lambda: obj.vectors(cache=False), retries, backoff)
+    vec = {col: np.array(tab[col], dtype=float) for col in VECTOR_COLUMNS}
+    return vec
+
+
+def fetch_ephemeris(
+        id, location, epochs, id_type="smallbody", retries=None,
+        backoff=None):
+    """Query ephemeris to Horizons without cache.
+
+    Parameters
+    ----------
+    id : int or str
+        target id
+    location : str
+        location of the observer (e.g., MPC observatory code)
+    epochs : float, list or dict
+        epochs of the query
+    id_type : str, optional
+        type of the id
+    retries : int, optional
+        number of retries of a transient failure (RETRIES by default)
+    backoff : float, optional
+        wait before the first retry in s, doubled on each retry
+        (BACKOFF by default)
+
+    Return
+    ------
+    eph : dict
+        arrays of EPHEM_COLUMNS
+    """
+    from astroquery.jplhorizons import Horizons
+
+    obj = Horizons(id=id, location=location, id_type=id_type, epochs=epochs)
+    tab = _retry(lambda: obj.ephemerides(cache=False), retries, backoff)
+    # Magnitudes of comets are not in V
+    eph = {
+        col: np.array(tab[col], dtype=float) if col in tab.colnames
+        else np.full(len(tab), np.nan) for col in EPHEM_COLUMNS}
+    return eph
+
+
+def _transient(e):
+    """Return True if a failure of a query may not happen again."""
+    import requests
+
+    if isinstance(e, (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout)):
+        return True
+    if isinstance(e, requests.exceptions.HTTPError):
+        status = getattr(e.response, "status_code", None)
+        return status is not None and (status == 429 or status >= 500)
+    return False
+
+
+def _retry(func, retries, backoff):
+    """Call func, retrying with exponential backoff on transient failure.
+
+    Network errors, timeouts and HTTP 429/5xx are retried. Other errors
+    (e.g., unknown target) are raised at once.
+    """
+    if retries is None:
+        retries = RETRIES
+    if backoff is None:
+        backoff = BACKOFF
+    for n in range(retries + 1):
+        try:
+            return func()
+        except Exception as e:
+            if n == retries or not _transient(e):
+                raise
+            time.sleep(backoff*2**n)
+
+
+def _query(
+        kind, fetch, id, location, epochs, cache, ttl, max_bytes, db, pin):
+    """Query to Horizons through the cache.
+
+    See query_vectors for the parameters.
+    """
+    if not cache:
+        return fetch(id, location, epochs)
+
+    key = cache_key(id, location, epochs, kind=kind)
+    now = time.time()
+    with _connect(db) as con:
+        row = con.execute(
+            "SELECT created, data FROM queries WHERE key = ?",
+            (key,)).fetchone()
+        if row is not None:
+            con.execute(
+                "UPDATE queries SET accessed = ? WHERE key = ?", (now, key))
+            if pin:
+                _pin(con, [key], True)
+    if row is not None and (ttl is None or now - row[0] < ttl):
+        return _decode(row[1])
+
+    try:
+        res = fetch(id, location, epochs)
+    except Exception:
+        if row is not None:
+            print(f"  Query failed, expired cache is used for {key}")
+            return _decode(row[1])
+        raise
+
+    data = _encode(res)
+    with _connect(db) as con:
+        old = con.execute(
+            "SELECT size, pinned FROM queries WHERE key = ?",
+            (key,)).fetchone()
+        # Pinned entries stay pinned
+        pinned = bool(pin or (old is not None and old[1]))
+        delta = (0 if pinned else len(data)) - (
+            old[0] if old is not None and not old[1] else 0)
+        con.execute(
+            "INSERT OR REPLACE INTO queries VALUES (?, ?, ?, ?, ?, ?)",
+            (key, now, now, len(data), data, int(pinned)))
+        total = _add_bytes(con, delta)
+        if total > max_bytes:
+            _evict(con, max_bytes)
+    return res
+
+
+def query_vectors(
+        id, location, epochs, cache=True, ttl=TTL, max_bytes=MAX_BYTES,
+        db=HORIZONS_DB, pin=False):
+    """Query vectors to Horizons through the cache.
+
+    Entries older than ttl are queried again; if the query fails (e.g.,
+    offline), the expired entry is used instead. The least recently used
+    entries are evicted when the cache exceeds max_bytes, unless pinned.
+
+    Parameters
+    ----------
+    id : int or str
+        target id
+    location : str
+        location of the observer
+    epochs : float, list or dict
+        epochs of the query
+    cache : bool, optional
+        use the cache
+    ttl : float, optional
+        time to live in s (None for no expiry)
+    max_bytes : int, optional
+        maximum size of the cache in bytes
+    db : str, optional
+        path to the cache database
+    pin : bool, optional
+        keep the entry from eviction (see unpin)
+
+    Return
+    ------
+    vec : dict
+        arrays of VECTOR_COLUMNS
+    """
+    return _query(
+        "vectors", fetch_vectors, id, location, epochs, cache, ttl,
+        max_bytes, db, pin)
+
+
+def query_ephemeris(
+        id, location, epochs, cache=True, ttl=TTL, max_bytes=MAX_BYTES,
+        db=HORIZONS_DB, pin=False):
+    """Query ephemeris of a small body to Horizons through the cache.
+
+    Parameters
+    ----------
+    id : int or str
+        target id (name or designation)
+    location : str
+        location of the observer (e.g., MPC observatory code)
+    epochs : float, list or dict
+        epochs of the query
+    cache : bool, optional
+        use the cache
+    ttl : float, optional
+        time to live in s (None for no expiry)
+    max_bytes : int, optional
+        maximum size of the cache in bytes
+    db : str, optional
+        path to the cache database
+    pin : bool, optional
+        keep the entry from eviction (see unpin)
+
+    Return
+    ------
+    eph : dict
+        arrays of EPHEM_COLUMNS
+    """
+    return _query(
+        "ephemerides", fetch_ephemeris, id, location, epochs, cache, ttl,
+        max_bytes, db, pin)
+
+
+def query_vectors_many(
+        queries, workers=WORKERS, max_epochs=MAX_EPOCHS, **kwargs):
+    """Query vectors of several targets to Horizons concurrently.
+
+    Long lists of epochs are split into queries of up to max_epochs
+    epochs, which run concurrently with the others and are cached
+    separately. Their results are concatenated in the order of epochs.
+
+    Parameters
+    ----------
+    queries : list of tuple
+        (id, location, epochs) of each query
+    workers : int, optional
+        maximum number of concurrent queries
+    max_epochs : int, optional
+        maximum number of discrete epochs in a query
+    kwargs : dict, optional
+        passed to query_vectors
+
+    Return
+    ------
+    vecs : list of dict
+        arrays of VECTOR_COLUMNS in the order of queries
+    """
+    # Index of the original query of each (split) query
+    parts = []
+    for idx, (id, location, epochs) in enumerate(queries):
+        if (isinstance(epochs, (list, tuple, np.ndarray))
+                and len(epochs) > max_epochs):
+            for idx0 in range(0, len(epochs), max_epochs):
+                parts.append(
+                    (idx, id, location, list(epochs[idx0:idx0 + max_epochs])))
+        else:
+            parts.append((idx, id, location, epochs))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(query_vectors, id, location, epochs, **kwargs)
+            for _, id, location, epochs in parts]
+        results = [[] for _ in queries]
+        for (idx, _, _, _), f in zip(parts, futures):
+            results[idx].append(f.result())
+
+    vecs = [
+        subs[0] if len(subs) == 1 else
+        {key: np.concatenate([sub[key] for sub in subs]) for key in subs[0]}
+        for subs in results]
+    return vecs
+
+
+def query_ephemerides(
+        ids, location, epochs, workers=WORKERS, batch=BATCH, **kwargs):
+    """Query ephemerides of many small bodies to Horizons.
+
+    Horizons takes one target per request, so targets are split into
+    batches whose queries run concurrently. Finished queries are saved
+    in the cache and pinned until all targets are queried, so that an
+    interrupted run (or a run with failed queries) resumes from there
+    and queries only the missing targets. The throughput is reported
+    after each batch.
+
+    Parameters
+    ----------
+    ids : list of str
+        target ids (names or designations)
+    location : str
+        location of the observer (e.g., MPC observatory code)
+    epochs : float, list or dict
+        epochs of the query
+    workers : int, optional
+        maximum number of concurrent queries
+    batch : int, optional
+        number of targets in a batch
+    kwargs : dict, optional
+        passed to query_ephemeris
+
+    Return
+    ------
+    ephs : list of dict
+        arrays of EPHEM_COLUMNS in the order of ids (None if failed)
+    """
+    def query(id):
+        try:
+            return query_ephemeris(id, location, epochs, pin=True, **kwargs)
+        except Exception as e:
+            print(f"  Query failed for {id}: {e}")
+            return None
+
+    N = len(ids)
+    ephs = []
+    t0 = time.time()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for idx in range(0, N, batch):
+            ephs.extend(pool.map(query, ids[idx:idx + batch]))
+            t_elapse = time.time() - t0
+            print(
+                f"  {len(ephs)}/{N} queried in {t_elapse:.1f} s "
+                f"({len(ephs)/t_elapse:.1f} obj/s)")
+    N_fail = sum(eph is None for eph in ephs)
+    if N_fail > 0:
+        print(f"  N_failed = {N_fail}")
+    elif kwargs.get("cache", True):
+        # The checkpoint is not necessary any more
+        unpin(
+            [cache_key(id, location, epochs, kind="ephemerides")
+             for id in ids],
+            max_bytes=kwargs.get("max_bytes", MAX_BYTES),
+            db=kwargs.get("db", HORIZONS_DB))
+    return ephs
+
+
+def unpin(keys=None, max_bytes=MAX_BYTES, db=HORIZONS_DB):
+    """Make pinned entries evictable again.
+
+    Parameters
+    ----------
+    keys : list of str, optional
+        keys from cache_key (all pinned entries by default)
+    max_bytes : int, optional
+        maximum size of the cache in bytes
+    db : str, optional
+        path to the cache database
+    """
+    with _connect(db) as con:
+        if keys is None:
+            keys = [row[0] for row in con.execute(
+                "SELECT key FROM queries WHERE pinned = 1")]
+        _pin(con, keys, False)
+        total = _add_bytes(con, 0)
+        if total > max_bytes:
+            _evict(con, max_bytes)
+
+
+def _pin(con, keys, pin):
+    """Pin or unpin entries, keeping the total size of evictable ones."""
+    size = 0
+    for idx in range(0, len(keys), 500):
+        sub = keys[idx:idx + 500]
+        marks = ",".join("?"*len(sub))
+        size += con.execute(
+            f"SELECT COALESCE(SUM(size), 0) FROM queries "
+            f"WHERE pinned = ? AND key IN ({marks})",
+            [int(not pin)] + sub).fetchone()[0]
+        con.execute(
+            f"UPDATE queries SET pinned = ? WHERE key IN ({marks})",
+            [int(pin)] + sub)
+    _add_bytes(con, -size if pin else size)
+
+
+def _add_bytes(con, delta):
+    """Add to the total size of evictable entries and return it."""
+    con.execute(
+        "UPDATE stats SET value = value + ? WHERE name = 'bytes'", (delta,))
+    return con.execute(
+        "SELECT value FROM stats WHERE name = 'bytes'").fetchone()[0]
+
+
+def _evict(con, max_bytes):
+    """Remove least recently used entries down to EVICT_TO of max_bytes.
+
+    Pinned entries are not removed. Entries are looked up through the
+    index on (pinned, accessed) in small batches.
+    """
+    total = _add_bytes(con, 0)
+    target = int(EVICT_TO*max_bytes)
+    while total > target:
+        rows = con.execute(
+            "SELECT key, size FROM queries WHERE pinned = 0 "
+            "ORDER BY accessed LIMIT 256").fetchall()
+        if not rows:
+            break
+        for key, size in rows:
+            if total <= target:
+                break
+            con.execute("DELETE FROM queries WHERE key = ?", (key,))
+            total -= size
+    con.execute(
+        "UPDATE stats SET value = ? WHERE name = 'bytes'", (max(total, 0),))
+
+
+def clear_cache(db=HORIZONS_DB):
+    """Remove all cached queries.
+
+    Parameter
+    ---------
+    db : str, optional
+        path to the cache database
+    """
+    if os.path.exists(db):
+        os.remove(db)
+
+
+def seed_planets(t_utc_list):
+    """Query positions and orbits of planets to seed the cache.
+
+    Seeded entries are pinned, i.e., not evicted.
+
+    Parameter
+    ---------
+    t_utc_list : list of str
+        times in utc
+    """
+    from .common import get_planet_positions, get_planet_orbits
+
+    for t_utc in t_utc_list:
+        get_planet_positions(t_utc, pin=True)
+        get_planet_orbits(t_utc, pin=True)
@@ -0,0 +1,584 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Load orbital elements from MPCORB.DAT.
+
+The file is read in bulk and the fixed-width fields are sliced out of a
+2-d byte array, so that no Python loop over the ~1.4 million records is
+needed.
+
+See https://www.minorplanetcenter.net/iau/info/MPOrbitFormat.html
+
+Parsed columns are cached as .npy files under common.DATA and reopened as
+memory maps in later runs, as long as the source file is unchanged.
+
+Rows can be selected with filters (ranges of numeric fields or q, lists
+of designations or names). Filters are evaluated on the fields they
+need one by one, on the remaining rows only, before the other columns
+are converted (or read from the cache).
+"""
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from .common import CACHE, MPCORB
+
+
+## Fixed-width fields in MPCORB.DAT (0-based, stop is exclusive)
+COLUMNS = {
+    # Designation in packed form
+    "desig": (0, 7),
+    # Absolute magnitude
+    "H": (7, 14),
+    # Slope parameter
+    "G": (14, 19),
+    # Epoch in packed form
+    "epoch": (20, 25),
+    # Mean anomaly in deg
+    "M": (26, 35),
+    # Argument of perihelion in deg
+    "omega": (37, 46),
+    # Longitude of the ascending node in deg
+    "Omega": (48, 57),
+    # Inclination in deg
+    "i": (59, 68),
+    # Eccentricity
+    "e": (70, 79),
+    # Mean daily motion in deg/day
+    "n": (80, 91),
+    # Semimajor axis in au
+    "a": (92, 103),
+    # Readable designation (name or provisional designation)
+    "name": (175, 193),
+}
+## Fields kept as strings
+STR_COLUMNS = ("desig", "epoch", "name")
+## Fields used for orbit propagation
+ORBIT_COLUMNS = ("epoch", "M", "omega", "Omega", "i", "e", "n", "a")
+
+_SPACE = ord(" ")
+_NEWLINE = ord("\n")
+_CR = ord("\r")
+## Size of the head and tail of the source file to be hashed
+_HASH_SIZE = 1 << 20
+## Typical length of a record in bytes (including the line break)
+_RECORD_SIZE = 203
+
+
+def read_records(fi=None):
+    """Read all orbit records of MPCORB.DAT as a 2-d byte array.
+
+    The header (up to the line starting with '---') and blank lines
+    separating the sections are skipped. Short lines are padded with spaces.
+
+    Parameter
+    ---------
+    fi : str, optional
+        path to MPCORB.DAT (common.MPCORB by default)
+
+    Return
+    ------
+    buf : numpy.ndarray
+        uint8 array with shape (N_record, record length)
+    """
+    if fi is None:
+        fi = MPCORB
+    with open(fi, "rb") as f:
+        raw = f.read()
+    data = np.frombuffer(raw, dtype=np.uint8)[_header_end(raw):]
+    return _records(data)
+
+
+def _header_end(raw):
+    """Return the index of the first record after the header."""
+    if raw.startswith(b"---"):
+        idx_start = raw.find(b"\n") + 1
+    else:
+        idx_sep = raw.find(b"\n---")
+        if idx_sep < 0:
+            # No header (e.g., NEAm00.txt)
+            idx_start = 0
+        else:
+            idx_start = raw.find(b"\n", idx_sep + 1) + 1
+    return idx_start
+
+
+def _records(data):
+    """Convert lines of records (uint8 array) to a 2-d byte array."""
+    # Line boundaries without line breaks
+    ends = np.flatnonzero(data == _NEWLINE)
+    if len(data) > 0 and data[-1] != _NEWLINE:
+        ends = np.append(ends, len(data))
+    width = max(stop for _, stop in COLUMNS.values())
+    if len(ends) == 0:
+        # No records (e.g., only the header)
+        return np.empty((0, width), dtype=np.uint8)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    ends = ends - ((ends > starts) & (data[ends - 1] == _CR))
+    lengths = ends - starts
+
+    # Short lines are padded up to all fields
+    width = max(int(lengths.max(initial=0)), width)
+    buf = np.full(
+        (np.count_nonzero(lengths), width), _SPACE, dtype=np.uint8)
+
+    # Consecutive lines with the same length are equally spaced in the file,
+    # so each run of them (i.e., each section of MPCORB.DAT) is copied at
+    # once through a strided view.
+    bounds = np.concatenate(
+        [[0], np.flatnonzero(np.diff(lengths)) + 1, [len(lengths)]])
+    row = 0
+    for idx0, idx1 in zip(bounds[:-1], bounds[1:]):
+        L = lengths[idx0]
+        if L == 0:
+            continue
+        st = starts[idx0:idx1]
+        stride = st[1] - st[0] if len(st) > 1 else 0
+        if np.all(np.diff(st) == stride):
+            lines = as_strided(
+                data[st[0]:], shape=(len(st), L), strides=(stride, 1),
+                writeable=False)
+        else:
+            lines = np.stack([data[s:s + L] for s in st])
+        buf[row:row + len(st), :L] = lines
+        row += len(st)
+
+    # Remove lines with only spaces
+    idx_cand = np.flatnonzero(buf[:, 0] == _SPACE)
+    if len(idx_cand) > 0:
+        idx_blank = idx_cand[np.all(buf[idx_cand] == _SPACE, axis=1)]
+        buf = np.delete(buf, idx_blank, axis=0)
+    return buf
+
+
+def field_bytes(buf, key):
+    """Extract a fixed-width field of all records.
+
+    Parameters
+    ----------
+    buf : numpy.ndarray
+        records from read_records
+    key : str
+        field name in COLUMNS
+
+    Return
+    ------
+    field : numpy.ndarray
+        uint8 array with shape (N_record, field width)
+    """
+    start, stop = COLUMNS[key]
+    return buf[:, start:stop]
+
+
+def field_to_str(field):
+    """Convert a fixed-width field to a stripped string array.
+
+    Parameter
+    ---------
+    field : numpy.ndarray
+        uint8 array with shape (N_record, field width)
+
+    Return
+    ------
+    values : numpy.ndarray
+        str array with shape (N_record,)
+    """
+    width = field.shape[1]
+    values = np.ascontiguousarray(field).view(f"S{width}").ravel()
+    return np.char.strip(values).astype(str)
+
+
+def field_to_float(field):
+    """Convert a fixed-width field to a float array.
+
+    Blank fields (e.g., H of some one-opposition objects) are set to NaN.
+
+    Parameter
+    ---------
+    field : numpy.ndarray
+        uint8 array with shape (N_record, field width)
+
+    Return
+    ------
+    values : numpy.ndarray
+        float64 array with shape (N_record,)
+    """
+    field = np.array(field, dtype=np.uint8, order="C")
+    width = field.shape[1]
+    blank = np.all(field == _SPACE, axis=1)
+    if np.any(blank):
+        field[blank, :3] = np.frombuffer(b"nan", dtype=np.uint8)
+    return field.view(f"S{width}").ravel().astype(np.float64)
+
+
+def _check_where(where):
+    """Check filters of rows."""
+    for key, cond in where.items():
+        if key != "q" and key not in COLUMNS:
+            raise ValueError(f"Unknown column in filters: {key}")
+        if key not in STR_COLUMNS and len(cond) != 2:
+            raise ValueError(f"Filter of {key} must be (min, max).")
+
+
+def _with_where(columns, where):
+    """Return columns plus fields used in filters."""
+    keys = list(columns)
+    for key in (where or {}):
+        for k in (("a", "e") if key == "q" else (key,)):
+            if k not in keys:
+                keys.append(k)
+    return keys
+
+
+def _select(get, N, where):
+    """Select rows satisfying all filters.
+
+    Parameters
+    ----------
+    get : callable
+        get(key, idx) returns values of a field at rows idx
+    N : int
+        number of rows
+    where : dict
+        filters (see load)
+
+    Return
+    ------
+    idx : numpy.ndarray
+        indices of selected rows
+    """
+    idx = np.arange(N)
+    for key, cond in where.items():
+        if key == "q":
+            val = get("a", idx)*(1 - get("e", idx))
+        else:
+            val = get(key, idx)
+        if key in STR_COLUMNS:
+            if val.dtype.kind == "S":
+                cond = [str(c).encode() for c in cond]
+            keep = np.isin(val, np.asarray(cond, dtype=val.dtype))
+        else:
+            vmin, vmax = cond
+            # NaN (blank field) never satisfies a filter
+            keep = ~np.isnan(val)
+            if vmin is not None:
+                keep &= (val >= vmin)
+            if vmax is not None:
+                keep &= (val <= vmax)
+        idx = idx[keep]
+    return idx
+
+
+def _select_records(buf, where):
+    """Select records satisfying all filters from raw fields."""
+    def get(key, idx):
+        start, stop = COLUMNS[key]
+        field = buf[idx, start:stop]
+        if key in STR_COLUMNS:
+            # Compared as bytes without conversion to str
+            values = np.ascontiguousarray(field).view(f"S{stop - start}")
+            return np.char.strip(values.ravel())
+        return field_to_float(field)
+    return buf[_select(get, len(buf), where)]
+
+
+def source_key(fi):
+    """Identify the content of a source file for the cache.
+
+    The size, the modification time and a hash of the first and last MiB
+    are used, so that the whole file need not be read.
+
+    Parameter
+    ---------
+    fi : str
+        path to MPCORB.DAT
+
+    Return
+    ------
+    key : dict
+        size, mtime_ns and hash of the file
+    """
+    st = os.stat(fi)
+    h = hashlib.sha1()
+    with open(fi, "rb") as f:
+        h.update(f.read(_HASH_SIZE))
+        if st.st_size > 2*_HASH_SIZE:
+            f.seek(-_HASH_SIZE, os.SEEK_END)
+            h.update(f.read())
+    key = dict(size=st.st_size, mtime_ns=st.st_mtime_ns, hash=h.hexdigest())
+    return key
+
+
+def cache_dir(fi=None):
+    """Return the cache directory of a source file.
+
+    Parameter
+    ---------
+    fi : str, optional
+        path to MPCORB.DAT (common.MPCORB by default)
+
+    Return
+    ------
+    d : str
+        path to the cache directory
+    """
+    if fi is None:
+        fi = MPCORB
+    fi = os.path.abspath(fi)
+    tag = hashlib.sha1(fi.encode()).hexdigest()[:8]
+    d = os.path.join(CACHE, f"{os.path.basename(fi)}_{tag}")
+    return d
+
+
+def clear_cache(fi=None):
+    """Remove the cache of a source file.
+
+    Parameter
+    ---------
+    fi : str, optional
+        path to MPCORB.DAT (common.MPCORB by default)
+    """
+    shutil.rmtree(cache_dir(fi), ignore_errors=True)
+
+
+def _open_cache(fi, columns):
+    """Open cached columns as memory maps.
+
+    The cache is removed when the source file has been changed.
+
+    Return
+    ------
+    cat : dict
+        memory-mapped arrays of columns found in the cache
+    """
+    d = cache_dir(fi)
+    fi_meta = os.path.join(d, "meta.json")
+    try:
+        with open(fi_meta, "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if meta.get("source") != source_key(fi):
+        clear_cache(fi)
+        return {}
+
+    cat = {}
+    for key in columns:
+        try:
+            cat[key] = np.load(os.path.join(d, f"{key}.npy"), mmap_mode="r")
+        except (OSError, ValueError):
+            pass
+    return cat
+
+
+def _write_cache(fi, cat):
+    """Save columns to the cache.
+
+    Files are written under temporary names and renamed, so that a reader
+    never sees a partially written column.
+    """
+    d = cache_dir(fi)
+    os.makedirs(d, exist_ok=True)
+    fi_meta = os.path.join(d, "meta.json")
+    key = source_key(fi)
+    try:
+        with open(fi_meta, "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        meta = {}
+    if meta.get("source") != key:
+        for name in os.listdir(d):
+            os.remove(os.path.join(d, name))
+        meta = dict(source=key, path=os.path.abspath(fi))
+
+    for name, val in cat.items():
+        fi_npy = os.path.join(d, f"{name}.npy")
+        fi_tmp = os.path.join(d, f".{name}.{os.getpid()}.npy")
+        np.save(fi_tmp, val)
+        os.replace(fi_tmp, fi_npy)
+
+    fi_tmp = os.path.join(d, f".meta.{os.getpid()}.json")
+    with open(fi_tmp, "w") as f:
+        json.dump(meta, f)
+    os.replace(fi_tmp, fi_meta)
+
+
+def parse(fi=None, columns=None, Nobj=None, where=None):
+    """Parse columns of MPCORB.DAT without cache.
+
+    Parameters
+    ----------
+    fi : str, optional
+        path to MPCORB.DAT (common.MPCORB by default)
+    columns : list of str, optional
+        fields to be loaded (all fields in COLUMNS by default)
+    Nobj : int, optional
+        parse only the first Nobj records (satisfying the filters)
+    where : dict, optional
+        filters of records (see load)
+
+    Return
+    ------
+    cat : dict
+        numpy arrays of fields with the same length
+    """
+    if columns is None:
+        columns = list(COLUMNS)
+    buf = read_records(fi)
+    if where:
+        _check_where(where)
+        buf = _select_records(buf, where)
+    return _convert(buf[:Nobj], columns)
+
+
+def _convert(buf, columns):
+    """Convert fields of records to arrays."""
+    cat = {}
+    for key in columns:
+        field = field_bytes(buf, key)
+        if key in STR_COLUMNS:
+            cat[key] = field_to_str(field)
+        else:
+            cat[key] = field_to_float(field)
+    return cat
+
+
+def load(fi=None, columns=None, Nobj=None, cache=True, where=None):
+    """Load orbital elements from MPCORB.DAT as numpy arrays.
+
+    Angles are in degrees as written in the file.
+    With cache=True, columns are read from the cache if the source file is
+    unchanged, otherwise parsed and saved to the cache. Cached columns are
+    read-only memory maps unless rows are selected with filters.
+
+    Filters in where map a numeric field in COLUMNS or q (perihelion
+    distance in au) to (min, max), where both limits are inclusive and
+    None means no limit, and desig or name to a list of values, e.g.,
+    where={"q": (None, 1.3), "H": (None, 99.)} for q <= 1.3 with H
+    (the strict limit of NEAs is in classify.RULES). Blank fields never
+    satisfy filters.
+
+    Parameters
+    ----------
+    fi : str, optional
+        path to MPCORB.DAT (common.MPCORB by default)
+    columns : list of str, optional
+        fields to be loaded (all fields in COLUMNS by default)
+    Nobj : int, optional
+        load only the first Nobj records (satisfying the filters)
+    cache : bool, optional
+        use the cache under common.DATA
+    where : dict, optional
+        filters of records
+
+    Return
+    ------
+    cat : dict
+        numpy arrays of fields with the same length
+    """
+    if fi is None:
+        fi = MPCORB
+    if columns is None:
+        columns = list(COLUMNS)
+    for key in columns:
+        if key not in COLUMNS:
+            raise ValueError(f"Unknown column: {key}")
+    if where:
+        _check_where(where)
+
+    if not cache:
+        return parse(fi, columns, Nobj, where)
+
+    # Fields used in filters are cached as well
+    keys = _with_where(columns, where)
+    cat = _open_cache(fi, keys)
+    missing = [key for key in keys if key not in cat]
+    if missing:
+        cat_new = parse(fi, missing)
+        try:
+            _write_cache(fi, cat_new)
+        except OSError as e:
+            print(f"  Cache is not saved: {e}")
+        cat.update(cat_new)
+
+    if where:
+        idx = _select(
+            lambda key, idx: cat[key][idx], len(cat[keys[0]]), where)
+        cat = {key: cat[key][idx[:Nobj]] for key in columns}
+    else:
+        cat = {key: cat[key][:Nobj] for key in columns}
+    return cat
+
+
+def iter_chunks(
+        fi=None, columns=None, chunk=2**18, cache=True, where=None):
+    """Iterate over MPCORB.DAT in chunks of columns.
+
+    Cached columns are sliced from the memory maps. Otherwise the file is
+    read and parsed block by block, so that the memory does not depend
+    on the size of the file (the cache is not written).
+
+    Parameters
+    ----------
+    fi : str, optional
+        path to MPCORB.DAT (common.MPCORB by default)
+    columns : list of str, optional
+        fields to be loaded (all fields in COLUMNS by default)
+    chunk : int, optional
+        number of records in a chunk (approximate without the cache)
+    cache : bool, optional
+        use the cache under common.DATA if all columns are cached
+    where : dict, optional
+        filters of records (see load), chunks are smaller accordingly
+
+    Yield
+    -----
+    cat : dict
+        numpy arrays of fields of a chunk with the same length
+    """
+    if fi is None:
+        fi = MPCORB
+    if columns is None:
+        columns = list(COLUMNS)
+    for key in columns:
+        if key not in COLUMNS:
+            raise ValueError(f"Unknown column: {key}")
+    if where:
+        _check_where(where)
+
+    if cache:
+        keys = _with_where(columns, where)
+        cat = _open_cache(fi, keys)
+        if all(key in cat for key in keys):
+            N = len(cat[keys[0]])
+            for idx0 in range(0, N, chunk):
+                sub = {key: cat[key][idx0:idx0 + chunk] for key in keys}
+                if where:
+                    idx = _select(
+                        lambda key, idx: sub[key][idx], len(sub[keys[0]]),
+                        where)
+                    sub = {key: sub[key][idx] for key in columns}
+                yield {key: sub[key] for key in columns}
+            return
+
+    with open(fi, "rb") as f:
+        # Skip the header, so that blocks start at the first record
+        f.seek(_header_end(f.read(_HASH_SIZE)))
+        rest = b""
+        while True:
+            block = f.read(chunk*_RECORD_SIZE)
+            data = rest + block
+            if block:
+                # Complete lines only
+                idx = data.rfind(b"\n") + 1
+                data, rest = data[:idx], data[idx:]
+            if data:
+                buf = _records(np.frombuffer(data, dtype=np.uint8))
+                if where:
+                    buf = _select_records(buf, where)
+                if len(buf) > 0:
+                    yield _convert(buf, columns)
+            if not block:
+                break
@@ -0,0 +1,371 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Two-body propagation of minor bodies.
+
+Objects are partitioned by orbit type (elliptic, parabolic and hyperbolic)
+and each group is solved at once, so that mixed catalogs can be propagated
+in one call.
+
+Positions and velocities are heliocentric in the ecliptic J2000 frame
+(the frame of the elements in MPCORB.DAT) in au and au/day.
+"""
+import numpy as np
+
+from .common import solve_kepler_eq, mpcepoch2jd_array
+
+
+## Gaussian gravitational constant in rad/day
+K_GAUSS = 0.01720209895
+## Gravitational parameter of the Sun in au^3/day^2
+MU_SUN = K_GAUSS**2
+## Orbits with |e - 1| <= E_PARABOLIC are regarded as parabolic
+E_PARABOLIC = 1e-8
+
+
+def solve_kepler_eq_hyp(M, e, tol=1e-12, max_iter=50):
+    """Solve hyperbolic Kepler equation M = e*sinh(H) - H.
+
+    Newton iterations start from H = sign(M)*ln(2|M|/e + 1.8) and are
+    applied only to elements not yet converged to |dH| < tol.
+
+    Parameters
+    ----------
+    M : array-like
+        mean anomaly
+    e : array-like
+        eccentricity (> 1)
+    tol : float, optional
+        tolerance of hyperbolic anomaly
+    max_iter : int, optional
+        maximum number of iterations
+
+    Return
+    ------
+    H : numpy.ndarray
+        hyperbolic anomaly
+    """
+    M, e = np.broadcast_arrays(
+        np.asarray(M, dtype=np.float64), np.asarray(e, dtype=np.float64))
+    shape = M.shape
+    M = M.ravel()
+    e = e.ravel()
+
+    H = np.sign(M)*np.log(2*np.abs(M)/e + 1.8)
+    idx = np.arange(len(M))
+    for _ in range(max_iter):
+        if len(idx) == 0:
+            break
+        H_a, e_a = H[idx], e[idx]
+        dH = (e_a*np.sinh(H_a) - H_a - M[idx]) / (e_a*np.cosh(H_a) - 1)
+        H[idx] = H_a - dH
+        idx = idx[np.abs(dH) > tol]
+    return H.reshape(shape)
+
+
+def solve_barker_eq(M):
+    """Solve Barker's equation M = D + D^3/3 for D = tan(nu/2).
+
+    Parameter
+    ---------
+    M : array-like
+        mean anomaly of parabolic orbit, sqrt(mu/(2q^3))*(t - T)
+
+    Return
+    ------
+    D : numpy.ndarray
+        tangent of the half of true anomaly
+    """
+    M = np.asarray(M, dtype=np.float64)
+    # Solved for |M| to avoid the cancellation in A + sqrt(A^2 + 1)
+    A = 1.5*np.abs(M)
+    B = np.cbrt(A + np.sqrt(A*A + 1))
+    D = np.sign(M)*(B - 1/B)
+    return D
+
+
+def anomaly(M, e, q):
+    """Calculate true anomaly and heliocentric distance.
+
+    Elliptic, parabolic and hyperbolic orbits are solved in batches.
+    The mean anomaly of parabolic and hyperbolic orbits is n*(t - T),
+    where T is the time of perihelion passage and n is the mean motion
+    (see mean_motion).
+
+    Parameters
+    ----------
+    M : array-like
+        mean anomaly in rad
+    e : array-like
+        eccentricity
+    q : array-like
+        perihelion distance in au
+
+    Returns
+    -------
+    nu : numpy.ndarray
+        true anomaly in rad
+    r : numpy.ndarray
+        heliocentric distance in au
+    """
+    M, e, q = np.broadcast_arrays(
+        np.asarray(M, dtype=np.float64), np.asarray(e, dtype=np.float64),
+        np.asarray(q, dtype=np.float64))
+    nu = np.full(M.shape, np.nan)
+    r = np.full(M.shape, np.nan)
+
+    # NaN is in none of them
+    mask_ell = e < 1 - E_PARABOLIC
+    mask_hyp = e > 1 + E_PARABOLIC
+    mask_par = np.abs(e - 1) <= E_PARABOLIC
+
+    if np.any(mask_ell):
+        e_ell = e[mask_ell]
+        E = solve_kepler_eq(M[mask_ell], e_ell)
+        nu[mask_ell] = 2*np.arctan2(
+            np.sqrt(1 + e_ell)*np.sin(E/2), np.sqrt(1 - e_ell)*np.cos(E/2))
+        r[mask_ell] = q[mask_ell]/(1 - e_ell)*(1 - e_ell*np.cos(E))
+
+    if np.any(mask_hyp):
+        e_hyp = e[mask_hyp]
+        H = solve_kepler_eq_hyp(M[mask_hyp], e_hyp)
+        nu[mask_hyp] = 2*np.arctan(
+            np.sqrt((e_hyp + 1)/(e_hyp - 1))*np.tanh(H/2))
+        r[mask_hyp] = q[mask_hyp]/(e_hyp - 1)*(e_hyp*np.cosh(H) - 1)
+
+    if np.any(mask_par):
+        D = solve_barker_eq(M[mask_par])
+        nu[mask_par] = 2*np.arctan(D)
+        r[mask_par] = q[mask_par]*(1 + D*D)
+
+    return nu, r
+
+
+def mean_motion(e, q):
+    """Calculate mean motion of any orbit type.
+
+    The mean motion of parabolic orbits is defined as sqrt(mu/(2q^3)),
+    so that M = n*(t - T) satisfies Barker's equation.
+
+    Parameters
+    ----------
+    e : array-like
+        eccentricity
+    q : array-like
+        perihelion distance in au
+
+    Return
+    ------
+    n : numpy.ndarray
+        mean motion in rad/day
+    """
+    e, q = np.broadcast_arrays(
+        np.asarray(e, dtype=np.float64), np.asarray(q, dtype=np.float64))
+    n = np.full(e.shape, np.nan)
+    mask_par = np.abs(e - 1) <= E_PARABOLIC
+    # |a| of elliptic and hyperbolic orbits
+    with np.errstate(divide="ignore", invalid="ignore"):
+        a_abs = q/np.abs(1 - e)
+        n[~mask_par] = K_GAUSS/a_abs[~mask_par]**1.5
+    n[mask_par] = K_GAUSS/np.sqrt(2*q[mask_par]**3)
+    return n
+
+
+def prepare(cat):
+    """Precompute per-object terms for propagation.
+
+    Angles are converted to radians, epochs to jd, and the rotation from
+    the orbital plane to the ecliptic is reduced to the unit vectors P
+    (to the perihelion) and Q (90 deg ahead in the orbital plane), so that
+    they are computed only once for any number of epochs.
+
+    Parameter
+    ---------
+    cat : dict
+        orbital elements as returned by mpcorb.load, i.e., M, omega,
+        Omega, i in deg, e, a in au, n in deg/day and epoch in packed
+        format. q in au and epoch_jd may be given instead of a and epoch.
+        n is calculated from e and q if not given.
+
+    Return
+    ------
+    orb : dict
+        epoch_jd, M0 (rad), n (rad/day), e, q (au), and
+        P, Q (arrays with shape (3, N))
+    """
+    e = np.asarray(cat["e"], dtype=np.float64)
+    if "q" in cat:
+        q = np.asarray(cat["q"], dtype=np.float64)
+    else:
+        q = np.asarray(cat["a"], dtype=np.float64)*(1 - e)
+    if "epoch_jd" in cat:
+        epoch_jd = np.asarray(cat["epoch_jd"], dtype=np.float64)
+    else:
+        epoch_jd = mpcepoch2jd_array(cat["epoch"])
+    if "n" in cat:
+        n = np.deg2rad(cat["n"])
+    else:
+        n = mean_motion(e, q)
+
+    omega = np.deg2rad(cat["omega"])
+    Omega = np.deg2rad(cat["Omega"])
+    i = np.deg2rad(cat["i"])
+    cos_Omega, sin_Omega = np.cos(Omega), np.sin(Omega)
+    cos_omega, sin_omega = np.cos(omega), np.sin(omega)
+    cos_i, sin_i = np.cos(i), np.sin(i)
+
+    P = np.empty((3, len(e)))
+    P[0] = cos_Omega*cos_omega - sin_Omega*sin_omega*cos_i
+    P[1] = sin_Omega*cos_omega + cos_Omega*sin_omega*cos_i
+    P[2] = sin_omega*sin_i
+    Q = np.empty((3, len(e)))
+    Q[0] = -cos_Omega*sin_omega - sin_Omega*cos_omega*cos_i
+    Q[1] = -sin_Omega*sin_omega + cos_Omega*cos_omega*cos_i
+    Q[2] = cos_omega*sin_i
+
+    orb = dict(
+        epoch_jd=epoch_jd, M0=np.deg2rad(cat["M"]), n=n, e=e, q=q, P=P, Q=Q)
+    return orb
+
+
+def propagate(orb, jd, velocity=False):
+    """Calculate heliocentric positions (and velocities) at an epoch.
+
+    Parameters
+    ----------
+    orb : dict
+        precomputed terms from prepare (or elements accepted by prepare)
+    jd : float
+        epoch in jd
+    velocity : bool, optional
+        return velocities as well
+
+    Returns
+    -------
+    x, y, z : numpy.ndarray
+        heliocentric ecliptic J2000 positions in au
+    vx, vy, vz : numpy.ndarray
+        heliocentric ecliptic J2000 velocities in au/day,
+        only if velocity is True
+    """
+    if "P" not in orb:
+        orb = prepare(orb)
+    # Linear assumption
+    M = orb["M0"] + orb["n"]*(jd - orb["epoch_jd"])
+    return _state(M, orb["e"], orb["q"], orb["P"], orb["Q"], velocity)
+
+
+def _state(M, e, q, P, Q, velocity):
+    """Calculate positions (and velocities) from mean anomaly.
+
+    P and Q have shape (3, ...) broadcastable with M.
+    """
+    nu, r = anomaly(M, e, q)
+    cos_nu, sin_nu = np.cos(nu), np.sin(nu)
+
+    # Position in the orbital plane
+    xp, yp = r*cos_nu, r*sin_nu
+    x = xp*P[0] + yp*Q[0]
+    y = xp*P[1] + yp*Q[1]
+    z = xp*P[2] + yp*Q[2]
+    if not velocity:
+        return x, y, z
+
+    # Velocity in the orbital plane with semi-latus rectum q*(1 + e)
+    v = np.sqrt(MU_SUN/(q*(1 + e)))
+    vxp, vyp = -v*sin_nu, v*(e + cos_nu)
+    vx = vxp*P[0] + vyp*Q[0]
+    vy = vxp*P[1] + vyp*Q[1]
+    vz = vxp*P[2] + vyp*Q[2]
+    return x, y, z, vx, vy, vz
+
+
+## Rough peak memory per (epoch, object) in propagate_epochs in bytes,
+## i.e., ~25 float64 temporaries (~30 with velocities)
+_BYTES_PER_ELEMENT = 200
+_BYTES_PER_ELEMENT_VEL = 250
+
+
+def chunk_shape(N_epoch, N_obj, memory=512*2**20, velocity=False):
+    """Decide the numbers of epochs and objects in a chunk.
+
+    Epochs are split first; objects are split only when a single epoch
+    of all objects does not fit in the memory budget.
+
+    Parameters
+    ----------
+    N_epoch : int
+        number of epochs
+    N_obj : int
+        number of objects
+    memory : int, optional
+        memory budget in bytes
+    velocity : bool, optional
+        whether velocities are calculated
+
+    Returns
+    -------
+    T_chunk : int
+        number of epochs in a chunk
+    N_chunk : int
+        number of objects in a chunk
+    """
+    nbyte = _BYTES_PER_ELEMENT_VEL if velocity else _BYTES_PER_ELEMENT
+    N_elem = max(int(memory)//nbyte, 1)
+    if N_obj <= N_elem:
+        N_chunk = max(N_obj, 1)
+        T_chunk = max(min(N_elem//N_chunk, N_epoch), 1)
+    else:
+        N_chunk = N_elem
+        T_chunk = 1
+    return T_chunk, N_chunk
+
+
+def propagate_epochs(orb, jds, velocity=False, memory=512*2**20):
+    """Calculate heliocentric positions at many epochs in chunks.
+
+    Positions of N objects at T epochs are yielded in chunks of
+    T_chunk x N_chunk, whose temporaries stay within the memory budget.
+    The per-object terms from prepare are reused for all epochs; only the
+    mean anomaly and the Kepler equation are evaluated per epoch.
+
+    Parameters
+    ----------
+    orb : dict
+        precomputed terms from prepare (or elements accepted by prepare)
+    jds : array-like
+        epochs in jd
+    velocity : bool, optional
+        yield velocities as well
+    memory : int, optional
+        memory budget in bytes (512 MB by default)
+
+    Yields
+    ------
+    sl_t : slice
+        indices of epochs in the chunk
+    sl_obj : slice
+        indices of objects in the chunk
+    x, y, z : numpy.ndarray
+        positions in au with shape (T_chunk, N_chunk)
+    vx, vy, vz : numpy.ndarray
+        velocities in au/day with shape (T_chunk, N_chunk),
+        only if velocity is True
+    """
+    if "P" not in orb:
+        orb = prepare(orb)
+    jds = np.atleast_1d(np.asarray(jds, dtype=np.float64))
+    N_epoch, N_obj = len(jds), len(orb["e"])
+    T_chunk, N_chunk = chunk_shape(N_epoch, N_obj, memory, velocity)
+
+    for idx_obj in range(0, N_obj, N_chunk):
+        sl_obj = slice(idx_obj, min(idx_obj + N_chunk, N_obj))
+        # Per-object terms of the chunk as row vectors
+        epoch_jd, M0, n, e, q = [
+            orb[key][sl_obj][None, :]
+            for key in ("epoch_jd", "M0", "n", "e", "q")]
+        P, Q = orb["P"][:, None, sl_obj], orb["Q"][:, None, sl_obj]
+        for idx_t in range(0, N_epoch, T_chunk):
+            sl_t = slice(idx_t, min(idx_t + T_chunk, N_epoch))
+            # Linear assumption
+            M = M0 + n*(jds[sl_t, None] - epoch_jd)
+            yield (sl_t, sl_obj) + _state(M, e, q, P, Q, velocity)
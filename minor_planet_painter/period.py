@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Period search of lightcurves.
+
+For phase folding (periodogram), trial periods are evaluated in blocks,
+i.e., the phases of all data points for a block of trial periods are
+computed as a 2D array, so that no Python loop runs over periods.
+Blocks can be distributed over a process pool. The full periodogram is
+returned.
+
+Wide period ranges are scanned with the Lomb-Scargle periodogram
+(lomb_scargle) of astropy, which is O(N log N) with the fast methods
+(Press & Rybicki 1989) and has a multi-harmonic variant for
+double-peaked lightcurves of asteroids. Its best period can be refined
+by phase folding in a narrow range.
+"""
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+
+## Rough memory per (period, data point) in bytes
+_BYTES_PER_ELEMENT = {"string": 48, "pdm": 56}
+
+
+def _phase(t, periods):
+    """Calculate phases with shape (N_period, N_data)."""
+    phase = np.multiply.outer(1/periods, t)
+    phase -= np.floor(phase)
+    return phase
+
+
+def string_length(t, y, periods):
+    """Calculate string lengths of folded lightcurves.
+
+    The string length is the sum of squared differences of successive
+    values sorted by phase (without the term connecting phase 1 to 0).
+    Phases are sorted as int64 keys with the data index in the lower
+    bits, which is faster than argsort.
+
+    Parameters
+    ----------
+    t : numpy.ndarray
+        time
+    y : numpy.ndarray
+        values (e.g., flux)
+    periods : numpy.ndarray
+        trial periods in the unit of t
+
+    Return
+    ------
+    stat : numpy.ndarray
+        string length for each period (smaller is better)
+    """
+    N = len(t)
+    Nbit = max(int(N - 1).bit_length(), 1)
+    key = (_phase(t, periods)*2.0**(62 - Nbit)).astype(np.int64)
+    key <<= Nbit
+    key |= np.arange(N)
+    key.sort(axis=1)
+    key &= (1 << Nbit) - 1
+    ys = y[key]
+    d = ys[:, 1:] - ys[:, :-1]
+    stat = np.einsum("ij,ij->i", d, d)
+    return stat
+
+
+def pdm(t, y, periods, Nbin=10):
+    """Calculate PDM statistics of folded lightcurves.
+
+    The theta statistic of Stellingwerf (1978), i.e., the pooled variance
+    in Nbin phase bins divided by the total variance.
+
+    Parameters
+    ----------
+    t : numpy.ndarray
+        time
+    y : numpy.ndarray
+        values (e.g., flux)
+    periods : numpy.ndarray
+        trial periods in the unit of t
+    Nbin : int, optional
+        number of phase bins
+
+    Return
+    ------
+    stat : numpy.ndarray
+        theta for each period (smaller is better)
+    """
+    B, N = len(periods), len(t)
+    b = np.minimum((_phase(t, periods)*Nbin).astype(np.int64), Nbin - 1)
+    # All bins of all periods at once
+    key = (b + (np.arange(B)*Nbin)[:, None]).ravel()
+    yy = np.broadcast_to(y, (B, N)).ravel()
+    n = np.bincount(key, minlength=B*Nbin).reshape(B, Nbin)
+    s1 = np.bincount(key, weights=yy, minlength=B*Nbin).reshape(B, Nbin)
+    s2 = np.bincount(key, weights=yy**2, minlength=B*Nbin).reshape(B, Nbin)
+
+    filled = n > 0
+    ss = np.where(filled, s2 - s1**2/np.where(filled, n, 1), 0.)
+    s2_within = np.sum(ss, axis=1)/(N - np.sum(filled, axis=1))
+    stat = s2_within/np.var(y, ddof=1)
+    return stat
+
+
+## Statistics of period search
+METHODS = {"string": string_length, "pdm": pdm}
+
+
+def _block(method, t, y, periods, kwargs):
+    """Evaluate a block of trial periods."""
+    return METHODS[method](t, y, periods, **kwargs)
+
+
+def periodogram(
+        t, y, periods, method="string", memory=32*2**20, Nproc=1,
+        **kwargs):
+    """Calculate a periodogram by phase folding.
+
+    Parameters
+    ----------
+    t : array-like
+        time
+    y : array-like
+        values (e.g., flux)
+    periods : array-like
+        trial periods in the unit of t
+    method : str, optional
+        'string' (string length) or 'pdm' (phase dispersion minimization)
+    memory : int, optional
+        rough memory budget of a block in bytes (small blocks stay in
+        the CPU cache)
+    Nproc : int, optional
+        number of processes
+    kwargs : dict, optional
+        passed to the statistic (e.g., Nbin for pdm)
+
+    Return
+    ------
+    stat : numpy.ndarray
+        statistic for each period (smaller is better)
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method: {method}")
+    t = np.asarray(t, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    periods = np.asarray(periods, dtype=np.float64)
+
+    B = max(int(memory//(_BYTES_PER_ELEMENT[method]*len(t))), 1)
+    blocks = [periods[idx:idx + B] for idx in range(0, len(periods), B)]
+    if Nproc > 1 and len(blocks) > 1:
+        with ProcessPoolExecutor(max_workers=Nproc) as pool:
+            stats = list(pool.map(
+                _block, [method]*len(blocks), [t]*len(blocks),
+                [y]*len(blocks), blocks, [kwargs]*len(blocks)))
+    else:
+        stats = [_block(method, t, y, p, kwargs) for p in blocks]
+    stat = np.concatenate(stats)
+    return stat
+
+
+def lomb_scargle(
+        t, y, min_period, max_period, nterms=2, samples_per_peak=10,
+        dy=None):
+    """Calculate a Lomb-Scargle periodogram over a wide period range.
+
+    The fast methods of astropy are used, i.e., 'fast' for nterms=1 and
+    'fastchi2' for the multi-harmonic model (nterms > 1).
+
+    Parameters
+    ----------
+    t : array-like
+        time
+    y : array-like
+        values (e.g., flux)
+    min_period, max_period : float
+        range of periods in the unit of t
+    nterms : int, optional
+        number of Fourier terms (2 for double-peaked lightcurves)
+    samples_per_peak : int, optional
+        number of frequencies per peak width
+    dy : array-like, optional
+        uncertainties of y
+
+    Returns
+    -------
+    periods : numpy.ndarray
+        periods in ascending order
+    power : numpy.ndarray
+        normalized power (larger is better)
+    """
+    from astropy.timeseries import LombScargle
+
+    ls = LombScargle(t, y, dy=dy, nterms=nterms)
+    method = "fast" if nterms == 1 else "fastchi2"
+    freq, power = ls.autopower(
+        minimum_frequency=1/max_period, maximum_frequency=1/min_period,
+        samples_per_peak=samples_per_peak, method=method)
+    periods = 1/freq[::-1]
+    power = np.asarray(power)[::-1]
+    return periods, power
+
+
+def best_period(periods, power, double_peaked=False, rtol=0.05):
+    """Select the best period of a periodogram.
+
+    With the multi-harmonic model, the peak at twice the period of a
+    double-peaked lightcurve is as high as the main peak. The longer one
+    is selected with double_peaked=True, as usual for asteroids.
+
+    Parameters
+    ----------
+    periods : numpy.ndarray
+        periods in ascending order
+    power : numpy.ndarray
+        power (larger is better)
+    double_peaked : bool, optional
+        select twice the period if its power is comparable
+    rtol : float, optional
+        relative tolerance of comparable power
+
+    Return
+    ------
+    P : float
+        best period
+    """
+    idx = np.argmax(power)
+    P = periods[idx]
+    if not double_peaked:
+        return P
+
+    # Peak around 2P within a few frequency steps
+    freq = 1/periods
+    df = 5*np.median(np.abs(np.diff(freq)))
+    near = np.flatnonzero(np.abs(freq - freq[idx]/2) <= df)
+    if len(near) > 0:
+        idx2 = near[np.argmax(power[near])]
+        if power[idx2] >= (1 - rtol)*power[idx]:
+            P = periods[idx2]
+    return P
+
+
+def find_period(
+        t, y, min_period, max_period, nterms=2, double_peaked=True,
+        method="string", Nrefine=10000, Nproc=1):
+    """Find the period in a wide range without an initial guess.
+
+    The Lomb-Scargle periodogram gives a candidate, which is refined by
+    phase folding in +-1% and then in +-0.05% of the candidate.
+
+    Parameters
+    ----------
+    t : array-like
+        time
+    y : array-like
+        values (e.g., flux)
+    min_period, max_period : float
+        range of periods in the unit of t
+    nterms : int, optional
+        number of Fourier terms of the Lomb-Scargle periodogram
+    double_peaked : bool, optional
+        prefer twice the period (see best_period)
+    method : str, optional
+        statistic of the refinement (see periodogram)
+    Nrefine : int, optional
+        number of trial periods in each refinement
+    Nproc : int, optional
+        number of processes of the refinement
+
+    Return
+    ------
+    P : float
+        best period
+    """
+    periods, power = lomb_scargle(t, y, min_period, max_period, nterms=nterms)
+    P = best_period(periods, power, double_peaked=double_peaked)
+    for width in (0.01, 0.0005):
+        ps = np.linspace(P*(1 - width), P*(1 + width), Nrefine)
+        stat = periodogram(t, y, ps, method=method, Nproc=Nproc)
+        P = ps[np.argmin(stat)]
+    return P
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Offline ephemeris of the planets from mean Keplerian elements.
+
+The elements and their secular rates are from Table 1 of
+E. M. Standish, "Keplerian Elements for Approximate Positions of the
+Major Planets" (https://ssd.jpl.nasa.gov/planets/approx_pos.html), valid
+for 1800-2050. Positions are heliocentric in the ecliptic J2000 frame.
+The errors are up to tens of arcseconds for the terrestrial planets,
+i.e., < 0.0005 au (Mars) and < 0.0001 au (Mercury), and up to several
+arcminutes for Jupiter and Saturn, i.e., ~0.01 and ~0.03 au, and
+~0.01 au for Uranus and Neptune (tests/test_planets.py). Pluto is
+included but not verified against an ephemeris. Positions from Horizons
+with location="@0" are barycentric and differ by the offset of the Sun
+(up to ~0.01 au) as well.
+"""
+import numpy as np
+
+from .orbit import prepare, propagate
+
+
+## Julian day of J2000.0
+JD_J2000 = 2451545.0
+
+## a [au], e, I [deg], L [deg], long.peri. [deg], long.node [deg] and
+## their rates per Julian century
+PLANET_ELEMENTS = {
+    "Mercury": (
+        (0.38709927, 0.20563593, 7.00497902,
+         252.25032350, 77.45779628, 48.33076593),
+        (0.00000037, 0.00001906, -0.00594749,
+         149472.67411175, 0.16047689, -0.12534081)),
+    "Venus": (
+        (0.72333566, 0.00677672, 3.39467605,
+         181.97909950, 131.60246718, 76.67984255),
+        (0.00000390, -0.00004107, -0.00078890,
+         58517.81538729, 0.00268329, -0.27769418)),
+    # Earth-Moon barycenter
+    "Earth": (
+        (1.00000261, 0.01671123, -0.00001531,
+         100.46457166, 102.93768193, 0.0),
+        (0.00000562, -0.00004392, -0.01294668,
+         35999.37244981, 0.32327364, 0.0)),
+    "Mars": (
+        (1.52371034, 0.09339410, 1.84969142,
+         -4.55343205, -23.94362959, 49.55953891),
+        (0.00001847, 0.00007882, -0.00813131,
+         19140.30268499, 0.44441088, -0.29257343)),
+    "Jupiter": (
+        (5.20288700, 0.04838624, 1.30439695,
+         34.39644051, 14.72847983, 100.47390909),
+        (-0.00011607, -0.00013253, -0.00183714,
+         3034.74612775, 0.21252668, 0.20469106)),
+    "Saturn": (
+        (9.53667594, 0.05386179, 2.48599187,
+         49.95424423, 92.59887831, 113.66242448),
+        (-0.00125060, -0.00050991, 0.00193609,
+         1222.49362201, -0.41897216, -0.28867794)),
+    "Uranus": (
+        (19.18916464, 0.04725744, 0.77263783,
+         313.23810451, 170.95427630, 74.01692503),
+        (-0.00196176, -0.00004397, -0.00242939,
+         428.48202785, 0.40805281, 0.04240589)),
+    "Neptune": (
+        (30.06992276, 0.00859048, 1.77004347,
+         -55.12002969, 44.96476227, 131.78422574),
+        (0.00026291, 0.00005105, 0.00035372,
+         218.45945325, -0.32241464, -0.00508664)),
+    "Pluto": (
+        (39.48211675, 0.24882730, 17.14001206,
+         238.92903833, 224.06891629, 110.30393684),
+        (-0.00031596, 0.00005170, 0.00004818,
+         145.20780515, -0.04062942, -0.01183482)),
+}
+
+
+def planet_elements(jd, names=None):
+    """Calculate mean orbital elements of planets.
+
+    Parameters
+    ----------
+    jd : float or array-like
+        epoch(s) in jd (TDB, utc is accurate enough here)
+    names : list of str, optional
+        names of planets (all in PLANET_ELEMENTS by default)
+
+    Return
+    ------
+    cat : dict
+        elements accepted by orbit.prepare, each with shape
+        jd.shape + (N_planet,)
+    """
+    if names is None:
+        names = list(PLANET_ELEMENTS)
+    jd = np.asarray(jd, dtype=np.float64)
+    elem0 = np.array([PLANET_ELEMENTS[name][0] for name in names])
+    rate = np.array([PLANET_ELEMENTS[name][1] for name in names])
+
+    # Julian centuries from J2000.0
+    T = (jd[..., None] - JD_J2000)/36525.
+    a, e, i, L, varpi, Omega = np.moveaxis(elem0 + rate*T[..., None], -1, 0)
+
+    cat = dict(
+        e=e, q=a*(1 - e), i=i, Omega=Omega, omega=varpi - Omega,
+        M=np.mod(L - varpi, 360.),
+        epoch_jd=np.broadcast_to(jd[..., None], e.shape))
+    return cat
+
+
+def planet_positions(jd, names=None):
+    """Calculate heliocentric positions of planets.
+
+    Parameters
+    ----------
+    jd : float or array-like
+        epoch(s) in jd
+    names : list of str, optional
+        names of planets (all in PLANET_ELEMENTS by default)
+
+    Return
+    ------
+    positions : dict
+        x, y, z in au of each planet (floats for scalar jd, arrays
+        otherwise)
+    """
+    if names is None:
+        names = list(PLANET_ELEMENTS)
+    jd = np.asarray(jd, dtype=np.float64)
+    cat = planet_elements(jd, names)
+    shape = cat["e"].shape
+
+    # All planets at all epochs at once
+    cat = {key: np.ravel(val) for key, val in cat.items()}
+    orb = prepare(cat)
+    x, y, z = propagate(orb, orb["epoch_jd"])
+    x, y, z = [val.reshape(shape) for val in (x, y, z)]
+
+    positions = {}
+    for idx, name in enumerate(names):
+        if jd.ndim == 0:
+            positions[name] = (float(x[idx]), float(y[idx]), float(z[idx]))
+        else:
+            positions[name] = (x[..., idx], y[..., idx], z[..., idx])
+    return positions
@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Apparent positions and sky motion of minor bodies computed locally.
+
+Positions and velocities from the two-body propagation (orbit.py) are
+combined with those of the observer, i.e., the Earth from the mean
+elements (planets.py, or given by hand) plus the observatory on the
+rotating Earth, and rotated to the equatorial J2000 frame. A single
+light-time correction is applied. The Earth of planets.py is the
+Earth-Moon barycenter, ~4700 km off the geocenter, which matters only
+for very close approaches; pass the Earth from Horizons in that case.
+
+The difference between synodic and sidereal rotation periods is
+predicted from the rate of the phase angle bisector around the spin
+axis (synodic_offset), for all objects at once.
+"""
+import numpy as np
+
+from .orbit import prepare, propagate
+
+
+## Speed of light in au/day
+C_AU_DAY = 173.1446326846693
+## Equatorial radius of the Earth in au
+R_EARTH_AU = 6378.137/1.495978707e8
+## Obliquity of the ecliptic at J2000.0 in deg
+OBLIQUITY = 23.4392911
+## Rotation rate of the Earth in rad/day
+OMEGA_EARTH = 2*np.pi*1.00273781191135448
+
+## Longitude in deg, rho*cos(phi') and rho*sin(phi') of observatories
+## (from the MPC list of observatory codes)
+OBSERVATORIES = {
+    # Geocenter
+    "500": (0.0, 0.0, 0.0),
+    # Kiso
+    "381": (137.6253, 0.82171, +0.56872),
+    # Mauna Kea
+    "568": (204.5278, 0.94171, +0.33725),
+}
+
+
+def _ecl2eq(x, y, z):
+    """Rotate ecliptic J2000 vectors to equatorial J2000."""
+    eps = np.deg2rad(OBLIQUITY)
+    cos_eps, sin_eps = np.cos(eps), np.sin(eps)
+    return x, y*cos_eps - z*sin_eps, y*sin_eps + z*cos_eps
+
+
+def gmst(jd):
+    """Calculate Greenwich mean sidereal time.
+
+    Parameter
+    ---------
+    jd : float or numpy.ndarray
+        julian day (utc)
+
+    Return
+    ------
+    theta : float or numpy.ndarray
+        Greenwich mean sidereal time in rad
+    """
+    d = jd - 2451545.0
+    theta = np.deg2rad(np.mod(280.46061837 + 360.98564736629*d, 360.))
+    return theta
+
+
+def observatory_state(jd, obscode):
+    """Calculate geocentric position and velocity of an observatory.
+
+    Parameters
+    ----------
+    jd : float
+        julian day (utc)
+    obscode : str or tuple
+        MPC observatory code in OBSERVATORIES or
+        (longitude in deg, rho*cos(phi'), rho*sin(phi'))
+
+    Returns
+    -------
+    pos : numpy.ndarray
+        equatorial J2000 position in au (precession is ignored)
+    vel : numpy.ndarray
+        equatorial J2000 velocity in au/day
+    """
+    if isinstance(obscode, str):
+        if obscode not in OBSERVATORIES:
+            raise ValueError(f"Unknown observatory code: {obscode}")
+        obscode = OBSERVATORIES[obscode]
+    lon, rho_cos, rho_sin = obscode
+    lst = gmst(jd) + np.deg2rad(lon)
+    cos_lst, sin_lst = np.cos(lst), np.sin(lst)
+    pos = R_EARTH_AU*np.array([rho_cos*cos_lst, rho_cos*sin_lst, rho_sin])
+    vel = R_EARTH_AU*OMEGA_EARTH*np.array(
+        [-rho_cos*sin_lst, rho_cos*cos_lst, 0.])
+    return pos, vel
+
+
+def earth_state(jd, dt=0.01):
+    """Calculate heliocentric state of the Earth from mean elements.
+
+    The velocity is the central difference of positions.
+
+    Parameters
+    ----------
+    jd : float
+        julian day
+    dt : float, optional
+        step of the difference in day
+
+    Returns
+    -------
+    pos : numpy.ndarray
+        ecliptic J2000 position in au
+    vel : numpy.ndarray
+        ecliptic J2000 velocity in au/day
+    """
+    from .planets import planet_positions
+
+    x, y, z = planet_positions(
+        np.array([jd - dt, jd, jd + dt]), names=["Earth"])["Earth"]
+    pos = np.array([x[1], y[1], z[1]])
+    vel = np.array([x[2] - x[0], y[2] - y[0], z[2] - z[0]])/(2*dt)
+    return pos, vel
+
+
+def observer_state(jd, obscode="500", earth=None):
+    """Calculate heliocentric position and velocity of an observer.
+
+    Parameters
+    ----------
+    jd : float
+        julian day (utc)
+    obscode : str or tuple, optional
+        observatory (see observatory_state)
+    earth : tuple, optional
+        heliocentric ecliptic J2000 position (au) and velocity (au/day)
+        of the Earth, from earth_state by default
+
+    Returns
+    -------
+    pos : numpy.ndarray
+        equatorial J2000 position in au
+    vel : numpy.ndarray
+        equatorial J2000 velocity in au/day
+    """
+    if earth is None:
+        earth = earth_state(jd)
+    pos_earth, vel_earth = earth
+    pos, vel = observatory_state(jd, obscode)
+    pos = np.array(_ecl2eq(*pos_earth)) + pos
+    vel = np.array(_ecl2eq(*vel_earth)) + vel
+    return pos, vel
+
+
+def distance(elements, jd, obscode="500", earth=None):
+    """Calculate distances of minor bodies from an observer.
+
+    Parameters
+    ----------
+    elements : dict
+        orbital elements accepted by orbit.prepare (or its output)
+    jd : float
+        julian day (utc)
+    obscode : str or tuple, optional
+        observatory (see observatory_state)
+    earth : tuple, optional
+        heliocentric ecliptic J2000 position (au) and velocity (au/day)
+        of the Earth, from earth_state by default
+
+    Return
+    ------
+    delta : numpy.ndarray
+        distance from the observer in au
+    """
+    orb = elements if "P" in elements else prepare(elements)
+    pos_obs, _ = observer_state(jd, obscode, earth=earth)
+    x, y, z = _ecl2eq(*propagate(orb, jd))
+    delta = np.sqrt(
+        (x - pos_obs[0])**2 + (y - pos_obs[1])**2 + (z - pos_obs[2])**2)
+    return delta
+
+
+def sky_rates(elements, jd, obscode="500", earth=None):
+    """Calculate apparent RA, Dec and their rates of minor bodies.
+
+    Parameters
+    ----------
+    elements : dict
+        orbital elements accepted by orbit.prepare (or its output)
+    jd : float
+        julian day (utc)
+    obscode : str or tuple, optional
+        observatory (see observatory_state)
+    earth : tuple, optional
+        heliocentric ecliptic J2000 position (au) and velocity (au/day)
+        of the Earth, from earth_state by default
+
+    Return
+    ------
+    sky : dict
+        RA, DEC in deg, RA_rate (with cos(DEC)), DEC_rate in arcsec/h
+        and delta (distance from the observer) in au, as in Horizons
+    """
+    orb = elements if "P" in elements else prepare(elements)
+    pos_obs, vel_obs = observer_state(jd, obscode, earth=earth)
+
+    # Light-time correction once with the geometric distance
+    x, y, z = _ecl2eq(*propagate(orb, jd))
+    delta = np.sqrt(
+        (x - pos_obs[0])**2 + (y - pos_obs[1])**2 + (z - pos_obs[2])**2)
+    x, y, z, vx, vy, vz = propagate(orb, jd - delta/C_AU_DAY, velocity=True)
+    x, y, z = _ecl2eq(x, y, z)
+    vx, vy, vz = _ecl2eq(vx, vy, vz)
+
+    # Topocentric
+    x, y, z = x - pos_obs[0], y - pos_obs[1], z - pos_obs[2]
+    vx, vy, vz = vx - vel_obs[0], vy - vel_obs[1], vz - vel_obs[2]
+    rho2_xy = x**2 + y**2
+    rho_xy = np.sqrt(rho2_xy)
+    delta2 = rho2_xy + z**2
+    delta = np.sqrt(delta2)
+
+    ra = np.mod(np.rad2deg(np.arctan2(y, x)), 360.)
+    dec = np.rad2deg(np.arctan2(z, rho_xy))
+    # rad/day to arcsec/h
+    conv = np.rad2deg(1.)*3600./24.
+    ra_rate = (x*vy - y*vx)/(rho_xy*delta)*conv
+    dec_rate = (vz*delta2 - z*(x*vx + y*vy + z*vz))/(delta2*rho_xy)*conv
+
+    sky = dict(
+        RA=ra, DEC=dec, RA_rate=ra_rate, DEC_rate=dec_rate, delta=delta)
+    return sky
+
+
+def pab_rate(elements, jd, pole, earth=None):
+    """Calculate the rate of the phase angle bisector around spin axes.
+
+    The phase angle bisector (PAB) is the sum of the unit vectors from
+    the object to the Sun and to the Earth (geocenter, light time is
+    ignored). Its angle around the pole changes at the rate
+    det(p, u, du/dt)/(|u|^2 - (p.u)^2), where u is the PAB and p is
+    the pole, which is evaluated analytically from the velocities.
+
+    Parameters
+    ----------
+    elements : dict
+        orbital elements accepted by orbit.prepare (or its output)
+    jd : float
+        julian day
+    pole : numpy.ndarray
+        ecliptic J2000 unit vectors of the spin poles with shape (3, N)
+    earth : tuple, optional
+        heliocentric ecliptic J2000 position (au) and velocity (au/day)
+        of the Earth, from earth_state by default
+
+    Return
+    ------
+    rate : numpy.ndarray
+        rate of the PAB longitude around the pole in rad/day
+    """
+    orb = elements if "P" in elements else prepare(elements)
+    if earth is None:
+        earth = earth_state(jd)
+    pos_earth, vel_earth = earth
+    x, y, z, vx, vy, vz = propagate(orb, jd, velocity=True)
+    r = np.array([x, y, z])
+    v = np.array([vx, vy, vz])
+
+    u = np.zeros_like(r)
+    du = np.zeros_like(r)
+    # Directions to the Sun (-r) and to the Earth, and their derivatives
+    for d, dd in ((-r, -v), (pos_earth[:, None] - r, vel_earth[:, None] - v)):
+        dist = np.sqrt(np.sum(d**2, axis=0))
+        d_hat = d/dist
+        u += d_hat
+        du += (dd - d_hat*np.sum(d_hat*dd, axis=0))/dist
+
+    det = np.sum(pole*np.cross(u, du, axis=0), axis=0)
+    rate = det/(np.sum(u**2, axis=0) - np.sum(pole*u, axis=0)**2)
+    return rate
+
+
+def synodic_offset(
+        elements, jds, pole_lon, pole_lat, P_sid, earth=None):
+    """Predict differences between synodic and sidereal periods.
+
+    The synodic frequency is the sidereal one minus the mean rate of
+    the phase angle bisector around the pole over the epochs (e.g., an
+    apparition), i.e., 1/P_syn = 1/P_sid - mean(rate)/(2 pi). Retrograde
+    rotators have poles of negative latitude.
+
+    Parameters
+    ----------
+    elements : dict
+        orbital elements accepted by orbit.prepare (or its output)
+    jds : array-like
+        julian days of the apparition
+    pole_lon, pole_lat : array-like
+        ecliptic J2000 longitudes and latitudes of spin poles in deg
+    P_sid : array-like
+        sidereal rotation periods in day
+    earth : list of tuple, optional
+        heliocentric ecliptic J2000 positions (au) and velocities
+        (au/day) of the Earth at jds, from earth_state by default
+
+    Return
+    ------
+    dP : numpy.ndarray
+        P_syn - P_sid in day
+    """
+    orb = elements if "P" in elements else prepare(elements)
+    jds = np.atleast_1d(np.asarray(jds, dtype=np.float64))
+    lon = np.deg2rad(np.asarray(pole_lon, dtype=np.float64))
+    lat = np.deg2rad(np.asarray(pole_lat, dtype=np.float64))
+    P_sid = np.asarray(P_sid, dtype=np.float64)
+    pole = np.array([
+        np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon), np.sin(lat)])
+    if pole.ndim == 1:
+        pole = pole[:, None]
+
+    rate = 0.
+    for n, jd in enumerate(jds):
+        rate = rate + pab_rate(
+            orb, jd, pole, earth=None if earth is None else earth[n])
+    rate = rate/len(jds)
+
+    P_syn = 1/(1/P_sid - rate/(2*np.pi))
+    dP = P_syn - P_sid
+    return dP
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""Make frames (and a movie) of spatial distribution of minor bodies.
+
+The catalog is loaded, prepared and classified only once. Frames are
+rendered in a pool of forked processes, which share the arrays with the
+parent copy-on-write, and each worker propagates the positions of its
+own frames.
+"""
+import os
+import time
+import shutil
+import argparse
+import subprocess
+import multiprocessing
+import numpy as np
+import matplotlib
+# Frames are only saved
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+
+from minor_planet_painter.common import (
+    MPCORB, jd2utc, utc2jd, get_planet_orbits, plot_black
+    )
+from minor_planet_painter.mpcorb import load, ORBIT_COLUMNS
+from minor_planet_painter.orbit import prepare, propagate
+from minor_planet_painter.planets import planet_positions
+from minor_planet_painter.classify import (
+    TAXONOMIES, classify, scatter_classes, density_classes)
+
+
+## Arrays shared with forked workers
+_SHARED = {}
+
+
+def render_frame(n):
+    """Render the n-th frame and return its filename.
+
+    Parameter
+    ---------
+    n : int
+        index of the frame
+    """
+    args = _SHARED["args"]
+    jd = _SHARED["jds"][n]
+    rules = TAXONOMIES[args.taxonomy]
+    x, y, _ = propagate(_SHARED["orb"], jd)
+
+    fig = plt.figure(figsize=(12, 12))
+    ax = fig.add_axes([0.1, 0.1, 0.85, 0.85])
+    r = args.range
+    if args.render == "density":
+        density_classes(
+            ax, x, y, _SHARED["code"], _SHARED["counts"], (-r, r, -r, r),
+            rules=rules, alpha=0.9)
+    else:
+        scatter_classes(
+            ax, x, y, _SHARED["code"], _SHARED["counts"], rules=rules,
+            s=0.5, alpha=0.9)
+
+    # Planet orbit
+    for name, (ox, oy) in _SHARED["planet_orbits"].items():
+        ax.plot(ox, oy, linestyle='-', linewidth=0.8, alpha=0.6, label=None)
+    # Planet
+    for name, (px, py, pz) in _SHARED["planet_positions"].items():
+        ax.scatter(px[n], py[n], s=40, ec="black", label=None)
+    # The Sun
+    ax.scatter(0, 0, color='yellow', s=50, ec="black", label=None, zorder=10)
+
+    ax.set_xlabel('X [AU]')
+    ax.set_ylabel('Y [AU]')
+    t_utc = jd2utc(jd)
+    ax.set_title(f'{t_utc:%Y-%m-%dT%H:%M:%S} UTC')
+    ax.set_xlim(-r, r)
+    ax.set_ylim(-r, r)
+    ax.set_aspect('equal')
+    ax.legend(fontsize=12, loc="upper right")
+    if args.black:
+        plot_black(ax)
+
+    out = os.path.join(args.outdir, f"frame_{n:04d}.png")
+    fig.savefig(out)
+    plt.close(fig)
+    return out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Make frames of minor planets from MPCORB.DAT")
+    parser.add_argument(
+        "epoch",
+        help="UTC epoch of the first frame, format YYYY-MM-DDTHH:MM:SS")
+    parser.add_argument(
+        "--days", type=float, default=365.,
+        help="Duration in day")
+    parser.add_argument(
+        "--step", type=float, default=1.,
+        help="Time step between frames in day")
+    parser.add_argument(
+        "--Nobj", type=int,
+        help="Number of asteroids to be plotted")
+    parser.add_argument(
+        "--range", type=float, default=6.5,
+        help="Plot range in AU (square from -range to +range)")
+    parser.add_argument(
+        "--MPCORB", default=None,
+        help="Path to MPCORB.DAT")
+    parser.add_argument(
+        "--no-cache", action="store_true", default=False,
+        help="Parse MPCORB.DAT without the binary cache")
+    parser.add_argument(
+        "--planets", choices=["horizons", "kepler"], default="kepler",
+        help="Source of planet positions (kepler: offline mean elements)")
+    parser.add_argument(
+        "--render", choices=["scatter", "density"], default="density",
+        help="Draw points (scatter) or a density image (density)")
+    parser.add_argument(
+        "--taxonomy", choices=list(TAXONOMIES), default="default",
+        help="Rule table of dynamical classes")
+    parser.add_argument(
+        "--black", action="store_true", default=False,
+        help="For slides with black background")
+    parser.add_argument(
+        "--Nproc", type=int, default=os.cpu_count(),
+        help="Number of processes")
+    parser.add_argument(
+        "--outdir", type=str, default="frames",
+        help="Directory of frames (frame_0000.png, ...)")
+    parser.add_argument(
+        "--mp4", type=str, default=None,
+        help="Make a movie with ffmpeg as well")
+    parser.add_argument(
+        "--fps", type=int, default=30,
+        help="Frames per second of the movie")
+    args = parser.parse_args()
+
+    if args.MPCORB is None:
+        fi = MPCORB
+    else:
+        fi = args.MPCORB
+    os.makedirs(args.outdir, exist_ok=True)
+
+    # Prepare once ============================================================
+    cat = load(
+        fi, columns=ORBIT_COLUMNS, Nobj=args.Nobj, cache=not args.no_cache)
+    print(f"  N_sssbs = {len(cat['M'])}")
+    orb = prepare(cat)
+    code, counts = classify(
+        cat["a"], cat["e"], cat["i"], rules=TAXONOMIES[args.taxonomy])
+
+    jd0 = utc2jd(args.epoch)
+    jds = jd0 + np.arange(0., args.days + 0.5*args.step, args.step)
+    t_utc0 = jd2utc(jd0).isoformat()
+    # Orbits of planets barely change during the movie
+    orbits = get_planet_orbits(t_utc0, source=args.planets)
+    if args.planets == "kepler":
+        positions = planet_positions(jds)
+    else:
+        from minor_planet_painter.horizons import query_vectors_many
+        ids = {
+            "Mercury": 1, "Venus": 2, "Earth": 3, "Mars": 4, "Jupiter": 5,
+            "Saturn": 6, "Uranus": 7, "Neptune": 8, "Pluto": 9}
+        # Frames are split into queries of up to MAX_EPOCHS epochs
+        vecs = query_vectors_many(
+            [(pid, "@0", list(jds)) for pid in ids.values()],
+            workers=len(ids))
+        positions = {
+            name: (vec["x"], vec["y"], vec["z"])
+            for name, vec in zip(ids, vecs)}
+
+    _SHARED.update(
+        args=args, orb=orb, code=code, counts=counts, jds=jds,
+        planet_orbits=orbits, planet_positions=positions)
+    # Prepare once ============================================================
+
+
+    # Render ==================================================================
+    N_frame = len(jds)
+    print(f"  N_frame = {N_frame}, N_proc = {args.Nproc}")
+    t0 = time.perf_counter()
+    # Workers are forked after _SHARED is set, so nothing is pickled but
+    # frame indices and filenames
+    ctx = multiprocessing.get_context("fork")
+    with ctx.Pool(args.Nproc) as pool:
+        for N_done, _ in enumerate(
+                pool.imap_unordered(render_frame, range(N_frame)), 1):
+            if N_done % 10 == 0 or N_done == N_frame:
+                t_elapse = time.perf_counter() - t0
+                print(
+                    f"    {N_done}/{N_frame} frames in {t_elapse:.1f} s "
+                    f"({N_done/t_elapse:.2f} frames/s)")
+    # Render ==================================================================
+
+
+    # Movie ===================================================================
+    if args.mp4 is not None:
+        if shutil.which("ffmpeg") is None:
+            print("  ffmpeg is not found. Frames are kept.")
+        else:
+            subprocess.run([
+                "ffmpeg", "-y", "-loglevel", "error",
+                "-framerate", str(args.fps),
+                "-i", os.path.join(args.outdir, "frame_%04d.png"),
+                "-pix_fmt", "yuv420p", "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2",
+                args.mp4], check=True)
+            print(f"  Movie is saved as {args.mp4}")
+    # Movie ===================================================================
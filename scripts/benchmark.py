@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""Benchmarks of minor_planet_painter.
+
+Example
+-------
+# Loading of MPCORB.DAT (line-by-line loop vs. bulk loader vs. cache,
+# and only NEAs with a filter)
+benchmark.py load --MPCORB MPCORB.DAT
+# Conversion between utc and jd (numpy vs. astropy)
+benchmark.py time --N 1000000
+# Kepler equation for all objects in MPCORB.DAT (fixed vs. active set)
+benchmark.py kepler --MPCORB MPCORB.DAT
+# Planet positions (Horizons vs. offline mean elements, needs network)
+benchmark.py planets --epoch 2025-08-25
+# Dynamical classification (boolean masks vs. class codes)
+benchmark.py classify --MPCORB MPCORB.DAT
+# Period search of the Psid/Psyn demo (loop vs. blocks vs. Lomb-Scargle)
+benchmark.py period --Nperiod 100000
+"""
+import os
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+
+from minor_planet_painter.common import (
+    MPCORB, utc2jd, jd2utc, solve_kepler_eq, get_planet_positions
+    )
+from minor_planet_painter.mpcorb import load, clear_cache, ORBIT_COLUMNS
+from minor_planet_painter.classify import (
+    RULES, CLASSES, TAXONOMIES, classify)
+from minor_planet_painter.period import periodogram, find_period
+
+
+def load_loop(fi):
+    """Parse MPCORB.DAT line by line as done in the scripts before.
+    """
+    M, omega, Omega, i, e, a = [], [], [], [], [], []
+    n = []
+    epoch = []
+    with open(fi, 'r') as f:
+        for line in f:
+            # End of header
+            if line.startswith('---'):
+                break
+        for line in f:
+            if len(line.strip()) == 0:
+                continue
+            epoch.append(line[20:25].strip())
+            M.append(float(line[26:35].strip()))
+            omega.append(float(line[37:46].strip()))
+            Omega.append(float(line[48:57].strip()))
+            i.append(float(line[59:68].strip()))
+            e.append(float(line[70:79].strip()))
+            a.append(float(line[92:103].strip()))
+            n.append(float(line[80:91].strip()))
+    return dict(
+        epoch=np.array(epoch), M=np.array(M), omega=np.array(omega),
+        Omega=np.array(Omega), i=np.array(i), e=np.array(e), a=np.array(a),
+        n=np.array(n))
+
+
+def timeit(func, *args, Nrep=3, **kwargs):
+    """Return the best elapsed time in s and the result of func.
+    """
+    t_best = np.inf
+    for _ in range(Nrep):
+        t0 = time.perf_counter()
+        res = func(*args, **kwargs)
+        t_best = min(t_best, time.perf_counter() - t0)
+    return t_best, res
+
+
+def bench_load(args):
+    t_loop, cat_loop = timeit(load_loop, args.MPCORB, Nrep=args.Nrep)
+    t_bulk, cat_bulk = timeit(
+        load, args.MPCORB, columns=ORBIT_COLUMNS, cache=False, Nrep=args.Nrep)
+    # Parse and save the cache, then open the cache as memory maps. The
+    # cache of a temporary copy is timed, so that of the file is kept.
+    with tempfile.TemporaryDirectory() as d:
+        fi = os.path.join(d, os.path.basename(args.MPCORB))
+        try:
+            os.link(args.MPCORB, fi)
+        except OSError:
+            shutil.copy2(args.MPCORB, fi)
+        try:
+            t_cold, _ = timeit(
+                load, fi, columns=ORBIT_COLUMNS, cache=True, Nrep=1)
+            t_warm, cat_warm = timeit(
+                load, fi, columns=ORBIT_COLUMNS, cache=True, Nrep=args.Nrep)
+            cat_warm = {key: np.array(val) for key, val in cat_warm.items()}
+        finally:
+            clear_cache(fi)
+    # Only NEAs (by the rule of classify), filter is evaluated before
+    # conversion of other columns
+    t_nea, cat_nea = timeit(
+        load, args.MPCORB, columns=ORBIT_COLUMNS, cache=False,
+        where=RULES[CLASSES.index("NEA")][3], Nrep=args.Nrep)
+
+    N = len(cat_bulk["a"])
+    for key in ORBIT_COLUMNS:
+        assert np.array_equal(cat_loop[key], cat_bulk[key]), key
+        assert np.array_equal(cat_loop[key], cat_warm[key]), key
+    print(f"  N_sssbs = {N}")
+    print(f"    Loop         : {t_loop:8.3f} s ({N/t_loop:12.0f} rows/s)")
+    print(f"    Bulk         : {t_bulk:8.3f} s ({N/t_bulk:12.0f} rows/s)")
+    print(f"    Cache (cold) : {t_cold:8.3f} s")
+    print(f"    Cache (warm) : {t_warm:8.3f} s ({N/t_warm:12.0f} rows/s)")
+    print(f"    Bulk (NEA)   : {t_nea:8.3f} s (N = {len(cat_nea['a'])})")
+    print(f"    Speedup x{t_loop/t_bulk:.1f} (bulk), x{t_loop/t_warm:.1f} (cache)")
+
+
+def bench_time(args):
+    N = args.N
+    rng = np.random.default_rng(0)
+    jd = rng.uniform(2400000.5, 2500000.5, N)
+    utc = np.datetime_as_string(jd2utc(jd))
+
+    t_fast, jd_fast = timeit(utc2jd, utc, Nrep=args.Nrep)
+    t_exact, jd_exact = timeit(utc2jd, utc, exact=True, Nrep=1)
+    t_fast_inv, _ = timeit(jd2utc, jd, Nrep=args.Nrep)
+    t_exact_inv, _ = timeit(jd2utc, jd, exact=True, Nrep=1)
+    # Scalar conversions as done per object before
+    Nscalar = min(N, 1000)
+    t_scalar, _ = timeit(
+        lambda: [utc2jd(u, exact=True) for u in utc[:Nscalar]], Nrep=1)
+    t_scalar *= N/Nscalar
+
+    dt_max = np.max(np.abs(jd_fast - jd_exact))*86400.
+    print(f"  N = {N}")
+    print(f"    utc2jd (numpy)          : {t_fast:8.3f} s")
+    print(f"    utc2jd (astropy)        : {t_exact:8.3f} s")
+    print(f"    utc2jd (astropy, scalar): {t_scalar:8.3f} s (estimated)")
+    print(f"    jd2utc (numpy)          : {t_fast_inv:8.3f} s")
+    print(f"    jd2utc (astropy)        : {t_exact_inv:8.3f} s")
+    print(f"    Speedup x{t_exact/t_fast:.1f} (utc2jd), "
+          f"x{t_exact_inv/t_fast_inv:.1f} (jd2utc)")
+    print(f"    Max difference {dt_max:.3f} s (leap seconds)")
+
+
+def solve_kepler_eq_fixed(M, e, max_iter=10):
+    """Solve Kepler equation with a fixed number of iterations as before.
+    """
+    E = M.copy()
+    for _ in range(max_iter):
+        E = E - (E - e*np.sin(E) - M) / (1 - e*np.cos(E))
+    return E
+
+
+def bench_kepler(args):
+    cat = load(args.MPCORB, columns=["M", "e"])
+    M = np.deg2rad(cat["M"])
+    e = np.array(cat["e"])
+
+    t_fixed, E_fixed = timeit(solve_kepler_eq_fixed, M, e, Nrep=args.Nrep)
+    t_active, (E_active, stats) = timeit(
+        solve_kepler_eq, M, e, return_stats=True, Nrep=args.Nrep)
+    res_fixed = np.abs(E_fixed - e*np.sin(E_fixed) - M)
+    res_active = np.abs(E_active - e*np.sin(E_active) - M)
+
+    N = stats["N"]
+    print(f"  N_sssbs = {N}")
+    print(f"    Fixed (10 iterations) : {t_fixed:8.3f} s, "
+          f"N_eval = {10*N}, max residual {np.nanmax(res_fixed):.1e}")
+    print(f"    Active set            : {t_active:8.3f} s, "
+          f"N_eval = {stats['N_eval']}, max residual {np.nanmax(res_active):.1e}")
+    print(f"    N_iter = {stats['N_iter']}, "
+          f"N_unconverged = {stats['N_unconverged']}")
+    for n_iter, N_conv in enumerate(stats["hist_iter"]):
+        if N_conv > 0:
+            print(f"      Converged at iteration {n_iter:2d}: {N_conv}")
+
+
+def bench_planets(args):
+    # Tolerance in au (see planets.py), including the offset of the Sun
+    # from the barycenter
+    tol = {
+        "Mercury": 0.02, "Venus": 0.02, "Earth": 0.02, "Mars": 0.02,
+        "Jupiter": 0.05, "Saturn": 0.1, "Uranus": 0.2, "Neptune": 0.2,
+        "Pluto": 0.2}
+
+    t_hor, pos_hor = timeit(
+        get_planet_positions, args.epoch, source="horizons", Nrep=1)
+    t_kep, pos_kep = timeit(
+        get_planet_positions, args.epoch, source="kepler", Nrep=args.Nrep)
+    print(f"  Epoch {args.epoch}")
+    print(f"    Horizons : {t_hor:8.3f} s")
+    print(f"    Kepler   : {t_kep*1e3:8.3f} ms")
+    for name, p_hor in pos_hor.items():
+        d = np.linalg.norm(np.array(p_hor) - np.array(pos_kep[name]))
+        status = "ok" if d < tol[name] else "NG"
+        print(f"      {name:8s}: {d:.4f} au (< {tol[name]} au) {status}")
+
+
+def classify_masks(a, e):
+    """Classify with boolean masks and an object array as done before.
+    """
+    q = a * (1 - e)
+    mask_nea = (q < 1.3)
+    mask_mba = (q >= 1.3) & (a >= 1.8) & (a <= 3.3)
+    mask_hilda = (q >= 1.3) & (a >= 3.7) & (a <= 4.0) & (e >= 0.07) & (e <= 0.3)
+    mask_trojan = (q >= 1.3) & (a >= 5.0) & (a <= 5.4)
+    mask_tno = (q >= 1.3) & (a >= 30.0)
+    masks = [mask_nea, mask_mba, mask_hilda, mask_trojan, mask_tno]
+
+    cols = ["red", "green", "orange", "blue", "skyblue", "gray"]
+    colors = np.full(a.shape, cols[-1], dtype=object)
+    for mask, col in zip(masks, cols):
+        colors[mask] = col
+    counts = [np.sum(mask) for mask in masks]
+    counts.append(len(a) - sum(counts))
+    return colors, np.array(counts)
+
+
+def bench_classify(args):
+    cat = load(args.MPCORB, columns=["a", "e", "i"])
+    a, e, i = np.array(cat["a"]), np.array(cat["e"]), np.array(cat["i"])
+
+    t_mask, (colors, counts_mask) = timeit(
+        classify_masks, a, e, Nrep=args.Nrep)
+    t_code, (code, counts) = timeit(classify, a, e, Nrep=args.Nrep)
+    assert np.array_equal(counts, counts_mask)
+
+    print(f"  N_sssbs = {len(a)}")
+    print(f"    Masks       : {t_mask:8.3f} s")
+    print(f"    Class codes : {t_code:8.3f} s")
+    print(f"    Speedup x{t_mask/t_code:.1f}")
+    for name, rules in TAXONOMIES.items():
+        _, (_, _, stats) = timeit(
+            classify, a, e, i, rules=rules, return_stats=True, Nrep=1)
+        print(f"    Rules {name} ({len(rules)} rules): "
+              f"{stats['t_elapse']:8.3f} s")
+        for cls, N in stats["counts"].items():
+            print(f"      {cls:8s}: {N}")
+
+
+def demo_lightcurve(P_sid=0.01, seed=0):
+    """Make the lightcurve of plot_sssb_Psid_Psyn.py.
+    """
+    rng = np.random.default_rng(seed)
+    P_orb_earth, P_orb_ast = 1.0, 5.0
+    aE, aA = 1.0, 2.5
+    t = np.concatenate([
+        np.linspace(t0, t0 + 0.04, 200) for t0 in (0, 0.25, 0.5, 0.75)])
+    thetaE = 2*np.pi*t/P_orb_earth
+    thetaA = 2*np.pi*t/P_orb_ast
+    alpha = np.arctan2(aE*np.sin(thetaE) - aA*np.sin(thetaA),
+                       aE*np.cos(thetaE) - aA*np.cos(thetaA))
+    flux = 1.0 + 0.25*np.cos(2*(2*np.pi*t/P_sid - alpha))
+    flux += rng.normal(0, 0.005, size=len(flux))
+    return t, flux
+
+
+def find_best_p_loop(t, f, ps):
+    """Search the period with a loop over periods as done before.
+    """
+    min_d = float('inf')
+    best = ps[0]
+    for p in ps:
+        phase = (t / p) % 1.0
+        idx = np.argsort(phase)
+        diff = np.sum(np.diff(f[idx])**2)
+        if diff < min_d:
+            min_d = diff
+            best = p
+    return best
+
+
+def bench_period(args):
+    P_sid = 0.01
+    t, f = demo_lightcurve(P_sid)
+    ps = np.linspace(P_sid*0.96, P_sid*1.04, args.Nperiod)
+
+    t_loop, p_loop = timeit(find_best_p_loop, t, f, ps, Nrep=1)
+    print(f"  N_data = {len(t)}, N_period = {len(ps)}")
+    print(f"    Loop              : {t_loop:8.3f} s, P = {p_loop:.8f}")
+    for method in ("string", "pdm"):
+        t_blk, stat = timeit(
+            periodogram, t, f, ps, method=method, Nrep=args.Nrep)
+        print(f"    Blocks ({method:6s})   : {t_blk:8.3f} s, "
+              f"P = {ps[np.argmin(stat)]:.8f} (x{t_loop/t_blk:.1f})")
+    # Without the guess of P_sid, 200x wider range
+    t_ls, p_ls = timeit(find_period, t, f, 0.002, 0.5, Nrep=args.Nrep)
+    print(f"    Lomb-Scargle      : {t_ls:8.3f} s, P = {p_ls:.8f} "
+          f"(x{t_loop/t_ls:.1f}, P = 0.002-0.5)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmarks of minor_planet_painter")
+    parser.add_argument(
+        "target",
+        choices=["load", "time", "kepler", "planets", "classify", "period"],
+        help="Target of the benchmark")
+    parser.add_argument(
+        "--MPCORB", default=MPCORB,
+        help="Path to MPCORB.DAT")
+    parser.add_argument(
+        "--Nrep", type=int, default=3,
+        help="Number of repetitions")
+    parser.add_argument(
+        "--N", type=int, default=1000000,
+        help="Number of conversions")
+    parser.add_argument(
+        "--Nperiod", type=int, default=100000,
+        help="Number of trial periods")
+    parser.add_argument(
+        "--epoch", default="2025-08-25T00:00:00",
+        help="UTC epoch for planets")
+    args = parser.parse_args()
+
+    if args.target == "load":
+        bench_load(args)
+    elif args.target == "time":
+        bench_time(args)
+    elif args.target == "kepler":
+        bench_kepler(args)
+    elif args.target == "planets":
+        bench_planets(args)
+    elif args.target == "classify":
+        bench_classify(args)
+    elif args.target == "period":
+        bench_period(args)
@@ -14,14 +14,36 @@ import argparse
 import numpy as np
 import matplotlib.pyplot as plt
 
+from minor_planet_painter.period import METHODS, periodogram, find_period
+
 def get_args():
     parser = argparse.ArgumentParser()
     parser.add_argument("--out", type=str, default="Psid_vs_Psyn_final_fixed.png")
+    parser.add_argument(
+        "--method", choices=list(METHODS), default="string",
+        help="Statistic of period search (string length or PDM)")
+    parser.add_argument(
+        "--search", choices=["ls", "grid"], default="ls",
+        help="Lomb-Scargle over a wide range (ls) or grids around Psid (grid)")
+    parser.add_argument(
+        "--Pmin", type=float, default=0.002,
+        help="Minimum period of the Lomb-Scargle search (Porb_earth = 1)")
+    parser.add_argument(
+        "--Pmax", type=float, default=0.5,
+        help="Maximum period of the Lomb-Scargle search (Porb_earth = 1)")
+    parser.add_argument(
+        "--Nproc", type=int, default=1,
+        help="Number of processes of period search")
+    parser.add_argument(
+        "--batch", action="store_true", default=False,
+        help="Do not import any GUI backend")
     return parser.parse_args()
 
 def main(args=None):
     if args is None:
         args = get_args()
+    if args.batch:
+        plt.switch_backend("Agg")
 
     P_orb_earth = 1.0
     P_orb_ast = 5.0
@@ -57,21 +79,20 @@ def main(args=None):
 
     def find_best_p(p_min, p_max, steps):
         ps = np.linspace(p_min, p_max, steps)
-        min_d = float('inf')
-        best = ps[0]
-        for p in ps:
-            phase = (all_t / p) % 1.0
-            idx = np.argsort(phase)
-            diff = np.sum(np.diff(all_f[idx])**2)
-            if diff < min_d:
-                min_d = diff
-                best = p
-        return best
+        stat = periodogram(
+            all_t, all_f, ps, method=args.method, Nproc=args.Nproc)
+        return ps[np.argmin(stat)]
     
-    # Should find local minimum
-    p_coarse = find_best_p(P_sid*0.96, P_sid * 1.04, 10000)
-    p_coarse2 = find_best_p(p_coarse*0.98, p_coarse * 1.02, 10000)
-    best_p = find_best_p(p_coarse2 * 0.98, p_coarse2 * 1.02, 1000000)
+    if args.search == "ls":
+        # Psid is not used, double-peaked lightcurve is assumed
+        best_p = find_period(
+            all_t, all_f, args.Pmin, args.Pmax, method=args.method,
+            Nproc=args.Nproc)
+    else:
+        # Should find local minimum
+        p_coarse = find_best_p(P_sid*0.96, P_sid * 1.04, 10000)
+        p_coarse2 = find_best_p(p_coarse*0.98, p_coarse * 1.02, 10000)
+        best_p = find_best_p(p_coarse2 * 0.98, p_coarse2 * 1.02, 1000000)
 
     plt.rcParams.update({'font.size': 12})
     fig = plt.figure(figsize=(18, 8))
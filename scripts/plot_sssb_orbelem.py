@@ -2,7 +2,6 @@
 """Make a figure of orbital elements.
 """
 import argparse
-import re
 import numpy as np
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
@@ -11,7 +10,34 @@ from erfa import ErfaWarning
 # To suppress ErfaWarning: ERFA function "dtf2d" yielded 1 of "dubious year (Note 6)"
 warnings.simplefilter('ignore', ErfaWarning)
 
-from minor_planet_painter import MPCORB, mycolor
+from minor_planet_painter import MPCORB, mycolor, save_figure
+from minor_planet_painter.mpcorb import load, iter_chunks
+from minor_planet_painter.classify import (
+    RULES, CLASSES, OTHERS, classify, tisserand, bin_index,
+    histogram_classes, composite_classes, legend_classes)
+
+
+## Histograms, i.e., (axis label, bin edges) of each quantity
+HISTS = {
+    "e": ("Eccentricity", np.arange(0, 1.01, 0.01)),
+    # Do not plot retrograde bodies
+    "i": ("Inclination [deg]", np.arange(0, 91, 1)),
+    "a": ("Semimajor axis [AU]", np.arange(0, 6.01, 0.02)),
+    "q": ("Perihelion distance [AU]", np.arange(0, 6.01, 0.02)),
+    "H": ("Absolute magnitude", np.arange(0, 35.1, 0.5)),
+    "T": ("Tisserand parameter w.r.t. Jupiter", np.arange(0, 6.01, 0.02)),
+}
+## 2D histograms of the survey, i.e., (x, y) in HISTS
+HISTS2D = (("a", "e"), ("a", "i"), ("a", "q"))
+
+
+def get_values(cat, key):
+    """Return values of a quantity of a chunk."""
+    if key == "q":
+        return cat["a"]*(1 - cat["e"])
+    if key == "T":
+        return tisserand(cat["a"], cat["e"], cat["i"])
+    return cat[key]
 
 
 if __name__ == "__main__":
@@ -20,13 +46,31 @@ if __name__ == "__main__":
     parser.add_argument(
         "--MPCORB", default=None, 
         help="Path to MPCORB.DAT")
+    parser.add_argument(
+        "--no-cache", action="store_true", default=False,
+        help="Parse MPCORB.DAT without the binary cache")
     parser.add_argument(
         "--onlyNEA", action="store_true", default=False, 
         help="Plot only NEA")
+    parser.add_argument(
+        "--stream", action="store_true", default=False,
+        help="Accumulate histograms chunk by chunk with bounded memory")
+    parser.add_argument(
+        "--chunk", type=int, default=2**18,
+        help="Number of objects in a chunk with --stream")
+    parser.add_argument(
+        "--batch", action="store_true", default=False,
+        help="Save the figure without showing it (no GUI, no prompt)")
     parser.add_argument(
         "--out", type=str, default="orbelem.jpg", 
         help="Figure name")
+    parser.add_argument(
+        "--out_survey", type=str, default="orbelem_survey.jpg",
+        help="Figure name of the survey (a-e, a-i, a-q, H and T_J)")
     args = parser.parse_args()
+    if args.batch:
+        # Do not import any GUI backend
+        plt.switch_backend("Agg")
     
     if args.MPCORB is None:
         fi = MPCORB
@@ -35,78 +79,55 @@ if __name__ == "__main__":
 
 
     # Extract orbital elements ================================================
-    M, omega, Omega, i, e, a = [], [], [], [], [], []
-    n = []
-    epoch = []
-    with open(fi, 'r') as f:
-        for line in f:
-            # End of header
-            if line.startswith('---'):
-                break 
-        for line in f:
-            if len(line.strip()) == 0:
-                continue
-            #if float(line[92:103].strip()) < 5.5:
-            #    continue
-            epoch.append(line[20:25].strip())
-            M.append(float(line[26:35].strip()))
-            omega.append(float(line[37:46].strip()))
-            Omega.append(float(line[48:57].strip()))
-            i.append(float(line[59:68].strip()))
-            e.append(float(line[70:79].strip()))
-            a.append(float(line[92:103].strip()))
-            n.append(float(line[80:91].strip()))
-    print(f"  N_sssbs = {len(M)}")
+    columns = ["a", "e", "i", "H"]
+    # Only NEAs are converted with --onlyNEA, by the same rule as classify
+    # (q < 1.3 as the inclusive range up to the float below 1.3)
+    where = RULES[CLASSES.index("NEA")][3] if args.onlyNEA else None
+    if args.stream:
+        chunks = iter_chunks(
+            fi, columns=columns, chunk=args.chunk, cache=not args.no_cache,
+            where=where)
+    else:
+        chunks = [
+            load(fi, columns=columns, cache=not args.no_cache, where=where)]
+
+    # Histograms of all classes (and panels) are accumulated chunk by chunk
+    # in a single pass, 2D ones on flattened bin indices
+    counts = np.zeros(len(CLASSES), dtype=np.int64)
+    hists = {key: None for key in HISTS}
+    hists2d = {key: None for key in HISTS2D}
+    for cat in chunks:
+        code, counts_chunk = classify(cat["a"], cat["e"])
+        counts += counts_chunk
+        idxs = {}
+        for key, (_, edges) in HISTS.items():
+            idxs[key] = bin_index(get_values(cat, key), edges)
+            hists[key] = histogram_classes(
+                code, idxs[key], len(edges) - 1, rules=RULES,
+                hist=hists[key])
+        for kx, ky in HISTS2D:
+            Nx, Ny = len(HISTS[kx][1]) - 1, len(HISTS[ky][1]) - 1
+            ix, iy = idxs[kx], idxs[ky]
+            idx = np.where((ix >= 0) & (iy >= 0), iy*Nx + ix, -1)
+            hists2d[(kx, ky)] = histogram_classes(
+                code, idx, Nx*Ny, rules=RULES, hist=hists2d[(kx, ky)])
+    print(f"  N_sssbs = {np.sum(counts)}")
     # Extract orbital elements ================================================
 
     
     # Plot ====================================================================
-    # Masks for classification
-    e = np.array(e)
-    i = np.array(i)
-    a = np.array(a)
-    q = a * (1 - e) 
-    mask_nea = (q < 1.3)
-    # q >= 1.3 is necessary to choose exclusively
-    mask_mba = (q >= 1.3) & (a >= 1.8) & (a <= 3.3)
-    mask_hilda = (q >= 1.3) & (a >= 3.7) & (a <= 4.0) & (e >= 0.07) & (e <= 0.3)
-    mask_trojan = (q >= 1.3) & (a >= 5.0) & (a <= 5.4)
-    mask_tno = (q >= 1.3) & (a >= 30.0)
-
-    # Colors
-    cols = ["red", "green", "orange", "blue", "skyblue", "gray"]
-
-    # Default: others
-    colors = np.full(a.shape, cols[-1], dtype=object) 
-    colors[mask_nea] = cols[0]
-    colors[mask_mba] = cols[1]
-    colors[mask_hilda] = cols[2]
-    colors[mask_trojan] = cols[3]
-    colors[mask_tno] = cols[4]
-    
-    # Count numbers 
-    N_all = len(a)
-    N_nea = np.sum(mask_nea)
-    N_mba = np.sum(mask_mba)
-    N_hilda = np.sum(mask_hilda)
-    N_trojan = np.sum(mask_trojan)
-    N_tno = np.sum(mask_tno)
-    N_others = N_all - (N_nea + N_mba + N_hilda + N_trojan + N_tno)
-    
-    # Labels
-    legend_labels = [
-        f"NEA (q<1.3): N={N_nea}",
-        f"MBA (q>=1.3, a=1.8–3.3): N={N_mba}",
-        f"Hilda (q$\geq$1.3, a=3.7-4.0, e=0.07-0.30): N={N_hilda}",
-        f"Trojan (q$\geq$1.3, a=5.0-5.4): N={N_trojan}",
-        f"TNO (q$\geq$1.3, a$\geq$30.0): N={N_tno}",
-        f"Others: N={N_others}"
-    ]
-
-    # 1. eccentricity
-    bin_e = np.arange(0, 1.01, 0.01)
-    # Do not plot retrograde bodies
-    bin_i = np.arange(0, 91, 1)
+    idx_nea = CLASSES.index("NEA")
+    idx_mba = CLASSES.index("MBA")
+    N_nea = counts[idx_nea]
+    N_mba = counts[idx_mba]
+
+    def plot_hist(ax, key, idx_cls, density=False, **kwargs):
+        """Plot the histogram of a class."""
+        edges = HISTS[key][1]
+        hist = hists[key][idx_cls].astype(np.float64)
+        if density and np.sum(hist) > 0:
+            hist /= np.sum(hist)*np.diff(edges)
+        ax.stairs(hist, edges, **kwargs)
 
     fig = plt.figure(figsize=(12, 8))
     ax_e = fig.add_axes([0.15, 0.60, 0.82, 0.35])
@@ -114,36 +135,26 @@ if __name__ == "__main__":
 
 
     if args.onlyNEA:
-        ax_e.hist(
-            e[mask_nea], histtype="step", bins=bin_e, color="black", 
-            label=f"NEA N={N_nea}")
-        ax_i.hist(
-            i[mask_nea], histtype="step", bins=bin_i, color="black", 
-            label=f"NEA N={N_nea}")
-        ax_e.set_ylabel('N')
-        ax_i.set_ylabel('N')
+        for key, ax in (("e", ax_e), ("i", ax_i)):
+            plot_hist(
+                ax, key, idx_nea, color="black", label=f"NEA N={N_nea}")
+            ax.set_ylabel('N')
     else:
         col_mba = mycolor[0]
         col_nea = mycolor[1]
-        ax_e.hist(
-            e[mask_mba], histtype="step", ls="solid", bins=bin_e, color=col_mba, 
-            label=f"MBA N={N_mba}", density=True)
-        ax_i.hist(
-            i[mask_mba], histtype="step", ls="solid", bins=bin_i, color=col_mba, 
-            label=f"MBA N={N_mba}", density=True)
-        ax_e.hist(
-            e[mask_nea], histtype="step", ls="dashed", bins=bin_e, color=col_nea, 
-            label=f"NEA N={N_nea}", density=True)
-        ax_i.hist(
-            i[mask_nea], histtype="step", ls="dashed", bins=bin_i, color=col_nea, 
-            label=f"NEA N={N_nea}", density=True)
-        ax_e.set_ylabel('Normalized fraction')
-        ax_i.set_ylabel('Normalized fraction')
-
-    ax_e.set_xlabel('Eccentricity')
+        for key, ax in (("e", ax_e), ("i", ax_i)):
+            plot_hist(
+                ax, key, idx_mba, density=True, ls="solid", color=col_mba,
+                label=f"MBA N={N_mba}")
+            plot_hist(
+                ax, key, idx_nea, density=True, ls="dashed", color=col_nea,
+                label=f"NEA N={N_nea}")
+            ax.set_ylabel('Normalized fraction')
+
+    ax_e.set_xlabel(HISTS["e"][0])
     ax_e.legend(fontsize=12)
 
-    ax_i.set_xlabel('Inclination [deg]')
+    ax_i.set_xlabel(HISTS["i"][0])
     ax_i.legend(fontsize=12)
 
     # Align 
@@ -151,19 +162,43 @@ if __name__ == "__main__":
     ax_e.yaxis.set_label_coords(x, y)
     ax_i.yaxis.set_label_coords(x, y)
 
-    plt.show(block=False)
-    
-    ans = input("  Save figure? (y/n): ").strip().lower()
-    if ans != 'y':
-        plt.close()
-    else:
-        try:
-            plt.savefig(args.out)
-            print(f"  Figure is saved as {args.out}")
-        except ValueError:
-            print("  Not saved. Exiting.")
-        plt.close()
-
-    # 2. Inclination
-    # 3. and so on......
+    save_figure(args.out, batch=args.batch)
+
+
+    # Survey (a-e, a-i, a-q, H and T_J) ======================================
+    fig = plt.figure(figsize=(18, 10))
+    for n, (kx, ky) in enumerate(HISTS2D):
+        ax = fig.add_axes([0.05 + 0.32*n, 0.56, 0.27, 0.40])
+        (xlabel, xedges), (ylabel, yedges) = HISTS[kx], HISTS[ky]
+        hist = hists2d[(kx, ky)].reshape(-1, len(yedges) - 1, len(xedges) - 1)
+        img = composite_classes(hist, counts, rules=RULES, alpha=0.1)
+        ax.imshow(
+            img, extent=(xedges[0], xedges[-1], yedges[0], yedges[-1]),
+            origin="lower", interpolation="nearest", aspect="auto")
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+
+    colors = [rule[2] for rule in RULES] + [OTHERS[2]]
+    for n, key in enumerate(("H", "T")):
+        ax = fig.add_axes([0.05 + 0.32*n, 0.07, 0.27, 0.38])
+        label, edges = HISTS[key]
+        for idx_cls, (name, color) in enumerate(zip(CLASSES, colors)):
+            if counts[idx_cls] == 0:
+                continue
+            ax.stairs(hists[key][idx_cls], edges, color=color)
+        ax.set_yscale("log")
+        ax.set_xlabel(label)
+        ax.set_ylabel("N")
+        if key == "T":
+            # Boundary between asteroidal and cometary orbits
+            ax.axvline(3, color="black", ls="dotted", lw=1)
+
+    # Legend of classes
+    ax = fig.add_axes([0.69, 0.07, 0.27, 0.38])
+    ax.axis("off")
+    legend_classes(ax, counts, rules=RULES, skip_empty=True)
+    ax.legend(fontsize=12, loc="center")
+
+    save_figure(args.out_survey, batch=args.batch)
+    # Survey (a-e, a-i, a-q, H and T_J) ======================================
     # Plot ====================================================================
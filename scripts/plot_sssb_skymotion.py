@@ -2,28 +2,21 @@
 """Make a figure of sky motion of minor bodies.
 """
 import argparse
-import re
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 from datetime import datetime
 import warnings
 from erfa import ErfaWarning
-from astroquery.jplhorizons import Horizons
 # To suppress ErfaWarning: ERFA function "dtf2d" yielded 1 of "dubious year (Note 6)"
 warnings.simplefilter('ignore', ErfaWarning)
 
-from minor_planet_painter.common import MPCORB
-
-
-def fetch_ephemeris(obj_name, obscode, epoch_jd):
-    obj = Horizons(id=obj_name, location=obscode, id_type="smallbody", epochs=epoch_jd)
-    eph = obj.ephemerides()
-    eph["RA_rate_arcsec_s"] = eph["RA_rate"]/3600.
-    eph["DEC_rate_arcsec_s"] = eph["DEC_rate"]/3600.
-    eph["vel"] = (eph["RA_rate_arcsec_s"]**2 + eph["DEC_rate_arcsec_s"]**2)**0.5
-    eph["targetname"] = obj_name
-    return eph.to_pandas()
+from minor_planet_painter.common import MPCORB, save_figure
+from minor_planet_painter.mpcorb import load, ORBIT_COLUMNS
+from minor_planet_painter.horizons import query_ephemerides, query_vectors
+from minor_planet_painter.orbit import prepare
+from minor_planet_painter.sky import sky_rates, earth_state
+from minor_planet_painter.classify import (
+    TAXONOMIES, classify, scatter_classes)
 
 
 def D_from_Hp(H, p, Herr=0, perr=0):
@@ -73,10 +66,40 @@ if __name__ == "__main__":
     parser.add_argument(
         "--MPCORB", default=None, 
         help="Path to MPCORB.DAT")
+    parser.add_argument(
+        "--no-cache", action="store_true", default=False,
+        help="Parse MPCORB.DAT without the binary cache")
+    parser.add_argument(
+        "--source", choices=["local", "horizons"], default="local",
+        help="Compute sky motion locally or query Horizons for each object")
+    parser.add_argument(
+        "--earth", choices=["kepler", "horizons"], default="kepler",
+        help="Source of the Earth position for --source local")
+    parser.add_argument(
+        "--check", type=int, default=0,
+        help="Compare local sky motion with Horizons for N random objects")
+    parser.add_argument(
+        "--workers", type=int, default=4,
+        help="Number of concurrent queries to Horizons")
+    parser.add_argument(
+        "--batch-size", type=int, default=100,
+        help="Number of objects per batch (progress is reported per batch)")
+    parser.add_argument(
+        "--no-horizons-cache", action="store_true", default=False,
+        help="Query Horizons without the cache (no resume)")
+    parser.add_argument(
+        "--taxonomy", choices=list(TAXONOMIES), default="default",
+        help="Rule table of dynamical classes")
+    parser.add_argument(
+        "--batch", action="store_true", default=False,
+        help="Save the figure without showing it (no GUI, no prompt)")
     parser.add_argument(
         "--out", type=str, default="skymotion.jpg", 
         help="Figure name")
     args = parser.parse_args()
+    if args.batch:
+        # Do not import any GUI backend
+        plt.switch_backend("Agg")
     
     if args.MPCORB is None:
         fi = MPCORB
@@ -88,138 +111,81 @@ if __name__ == "__main__":
     epoch_jd = 2462240.4111111113
 
     # Extract object name and H ================================================
-    obj_list = []
-    H_list = []
-    i, e, a = [], [], []
-
-    with open(fi, 'r') as f:
-        for line in f:
-            # End of header
-            if line.startswith('---'):
-                break 
-        for line in f:
-            if len(line.strip()) == 0:
-                continue
-            H = line[7:14].strip()
-            # N=18
-            obj = line[175:193].strip()
-
-            # Some asteroids have no H (e.g., WISE discovery)
-            if H == "":
-                continue
-            
-            # Do not plot H=99.99 for this purpose
-            if H == "99.99":
-                continue
-            H_list.append(H)
-            obj_list.append(obj)
-            i.append(float(line[59:68].strip()))
-            e.append(float(line[70:79].strip()))
-            a.append(float(line[92:103].strip()))
-
-            if args.Nobj is not None and len(a) >= args.Nobj:
-                break  
-
+    # Some asteroids have no H (e.g., WISE discovery)
+    # Do not plot H=99.99 for this purpose
+    cat = load(
+        fi, columns=ORBIT_COLUMNS + ("H", "name"), cache=not args.no_cache,
+        where={"H": (None, 99.)})
+    # Add Apophis even if it is not in the first Nobj objects
+    mask_use = np.zeros(len(cat["H"]), dtype=bool)
+    mask_use[:args.Nobj] = True
+    mask_use |= (cat["name"] == "(99942) Apophis")
+    cat = {key: val[mask_use] for key, val in cat.items()}
+    obj_list = cat["name"]
     print(f"  N_sssbs = {len(obj_list)}")
 
-    H_list = np.array(H_list)
-    obj_list = np.array(obj_list)
-
-    i = np.deg2rad(np.array(i))
-    e = np.array(e)
-    a = np.array(a)
-    H = np.array(H)
-
+    e = cat["e"]
+    a = cat["a"]
+    H = cat["H"]
     # Extract object name and H ================================================
 
 
-    # Add Apophis by hand =====================================================
-    H = np.append(H, 19)
-    obj_list = np.append(obj_list, "Apophis")
-    a = np.append(a, 0.92)
-    e = np.append(e, 0.19)
-    i = np.append(i, 3.34)
-    # Add Apophis by hand =====================================================
-
-
-    # Query sky motion ========================================================
-    # t_elapse ~ 1 m when N = 100
+    # Sky motion ==============================================================
     # From Kiso, Japan
     obscode = "381"
-    results = []
-    for obj in obj_list:
-        res = fetch_ephemeris(obj, obscode, epoch_jd)
-        results.append(res)
-    df = pd.concat(results)
-    vel = df["vel"].to_numpy()
-    # Query sky motion ========================================================
+    if args.source == "local":
+        if args.earth == "horizons":
+            # Geocenter from the Sun in the ecliptic frame
+            vec = query_vectors(399, "@10", epoch_jd)
+            earth = (
+                np.array([vec[c][0] for c in ("x", "y", "z")]),
+                np.array([vec[c][0] for c in ("vx", "vy", "vz")]))
+        else:
+            earth = earth_state(epoch_jd)
+        orb = prepare(cat)
+        sky = sky_rates(orb, epoch_jd, obscode, earth=earth)
+        # arcsec/h to arcsec/s
+        vel = np.hypot(sky["RA_rate"], sky["DEC_rate"])/3600.
+    else:
+        # Finished queries are cached, so rerun to resume an interrupted run
+        ephs = query_ephemerides(
+            list(obj_list), obscode, epoch_jd, workers=args.workers,
+            batch=args.batch_size, cache=not args.no_horizons_cache)
+        # arcsec/h to arcsec/s (NaN if failed)
+        vel = np.array([
+            np.hypot(eph["RA_rate"][0], eph["DEC_rate"][0])/3600.
+            if eph is not None else np.nan for eph in ephs])
+
+    # Spot-check with Horizons
+    if args.check > 0:
+        rng = np.random.default_rng(0)
+        idx = rng.choice(
+            len(obj_list), min(args.check, len(obj_list)), replace=False)
+        ephs = query_ephemerides(
+            list(obj_list[idx]), obscode, epoch_jd, workers=args.workers,
+            batch=args.batch_size, cache=not args.no_horizons_cache)
+        print("  Sky motion [arcsec/s] (this script vs. Horizons)")
+        for n, eph in zip(idx, ephs):
+            if eph is None:
+                continue
+            vel_h = np.hypot(eph["RA_rate"][0], eph["DEC_rate"][0])/3600.
+            print(
+                f"    {obj_list[n]:<20} {vel[n]:.4e} {vel_h:.4e} "
+                f"({(vel[n] - vel_h)/vel_h*100:+.2f} %)")
+    # Sky motion ==============================================================
 
 
     # Plot ====================================================================
-    # Masks for classification
-    q = a * (1 - e) 
-    mask_nea = (q < 1.3)
-    # q >= 1.3 is necessary to choose exclusively
-    mask_mba = (q >= 1.3) & (a >= 1.8) & (a <= 3.3)
-    mask_hilda = (q >= 1.3) & (a >= 3.7) & (a <= 4.0) & (e >= 0.07) & (e <= 0.3)
-    mask_trojan = (q >= 1.3) & (a >= 5.0) & (a <= 5.4)
-    mask_tno = (q >= 1.3) & (a >= 30.0)
-
-    # Colors
-    cols = ["red", "green", "orange", "blue", "skyblue", "gray"]
-
-    # Default: others
-    colors = np.full(a.shape, cols[-1], dtype=object) 
-    colors[mask_nea] = cols[0]
-    colors[mask_mba] = cols[1]
-    colors[mask_hilda] = cols[2]
-    colors[mask_trojan] = cols[3]
-    colors[mask_tno] = cols[4]
-    
-    # Count numbers 
-    N_all = len(a)
-    N_nea = np.sum(mask_nea)
-    N_mba = np.sum(mask_mba)
-    N_hilda = np.sum(mask_hilda)
-    N_trojan = np.sum(mask_trojan)
-    N_tno = np.sum(mask_tno)
-    N_others = N_all - (N_nea + N_mba + N_hilda + N_trojan + N_tno)
-    
-    # Labels
-    label_list = []
-    if N_nea > 0:
-        label_list.append(f"NEA (q<1.3): N={N_nea}")
-    else:
-        del cols[-1]
-    if N_mba > 0:
-        label_list.append(f"MBA (q>=1.3, a=1.8–3.3): N={N_mba}")
-    else:
-        del cols[-1]
-    if N_hilda > 0:
-        label_list.append(f"Hilda (q$\geq$1.3, a=3.7-4.0, e=0.07-0.30): N={N_hilda}")
-    else:
-        del cols[-1]
-    if N_trojan > 0:
-        label_list.append(f"Trojan (q$\geq$1.3, a=5.0-5.4): N={N_trojan}")
-    else:
-        del cols[-1]
-    if N_tno > 0:
-        label_list.append(f"TNO (q$\geq$1.3, a$\geq$30.0): N={N_tno}")
-    else:
-        del cols[-1]
-    if N_others > 0:
-        label_list.append(f"Others: N={N_others}")
-    else:
-        del cols[-1]
+    # Classification
+    rules = TAXONOMIES[args.taxonomy]
+    code, counts = classify(a, e, cat["i"], rules=rules)
 
     fig = plt.figure(figsize=(12, 6))
     ax = fig.add_axes([0.1, 0.15, 0.85, 0.75])
 
-    ax.scatter(
-        a, vel, s=1.5, color=colors, alpha=0.5, label='_nolegend_')
-    # Dummy to show legends
-    for label, color in zip(label_list, cols):
-        ax.scatter([], [], color=color, label=label, s=20)
+    scatter_classes(
+        ax, a, vel, code, counts, rules=rules,
+        skip_empty=True, s=1.5, alpha=0.5)
 
     ax.set_xlabel('Semimajor axis [au]', fontsize=20)
     ax.set_ylabel('Sky motion [arcsec/s]', fontsize=20)
@@ -227,17 +193,5 @@ if __name__ == "__main__":
     ax.set_title(f'{epoch_utc} UTC')
     ax.legend(fontsize=12)
     ax.set_yscale("log")
-    plt.show(block=False)
-    
-    print()
-    ans = input("  Save figure? (y/n): ").strip().lower()
-    if ans != 'y':
-        plt.close()
-    else:
-        try:
-            plt.savefig(args.out)
-            print(f"  Figure is saved as {args.out}")
-        except ValueError:
-            print("  Not saved. Exiting.")
-        plt.close()
+    save_figure(args.out, batch=args.batch)
     # Plot ====================================================================
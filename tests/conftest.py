@@ -0,0 +1,141 @@
+import os
+import re
+import time
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+
+## Sample responses of the Horizons API shipped with astroquery
+_DATA = os.path.join(
+    os.path.dirname(__import__("astroquery.jplhorizons").jplhorizons.__file__),
+    "tests", "data")
+_UNKNOWN = (
+    "API VERSION: 1.0\nAPI SOURCE: NASA/JPL Horizons API\n\n"
+    "*******************************************************************\n"
+    "Matching small-bodies:\n    No matches found.\n")
+
+
+def _template(name):
+    """Split a sample response around the rows between $$SOE and $$EOE."""
+    with open(os.path.join(_DATA, name)) as f:
+        text = f.read()
+    head, rest = text.split("$$SOE\n")
+    row, tail = rest.split("$$EOE\n")
+    return head + "$$SOE\n", row.strip("\n"), "$$EOE\n" + tail
+
+
+def _epochs(params):
+    """Return jds of the query (TLIST or START_TIME/STOP_TIME/STEP_SIZE)."""
+    if "TLIST" in params:
+        return [float(v) for v in params["TLIST"].split()]
+    start = datetime.fromisoformat(params["START_TIME"].strip("\"'"))
+    stop = datetime.fromisoformat(params["STOP_TIME"].strip("\"'"))
+    step = float(re.match(r"\d+", params["STEP_SIZE"].strip("\"'")).group())
+    jds, t = [], start
+    while t <= stop:
+        dt = t - datetime(1970, 1, 1)
+        jds.append(2440587.5 + dt.total_seconds()/86400)
+        t += timedelta(days=step)
+    return jds
+
+
+class StubHorizons:
+    """State of the stub server.
+
+    Targets are numbers, which are returned in x (vectors) or RA
+    (ephemerides). Targets in fail get HTTP 503 as many times as given,
+    and those starting with 'bad' are unknown.
+    """
+
+    def __init__(self, delay=0.):
+        self.delay = delay
+        self.fail = {}
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self.vectors = _template("ceres_vectors_single.txt")
+        self.ephemerides = _template("ceres_ephemerides_single.txt")
+
+    def respond(self, params):
+        """Return the HTTP status and the body of a query."""
+        target = params["COMMAND"].strip("\"'").rstrip(";")
+        with self.lock:
+            self.requests.append(target)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            with self.lock:
+                if self.fail.get(target, 0) > 0:
+                    self.fail[target] -= 1
+                    return 503, "Service Unavailable"
+            if target.startswith("bad"):
+                return 200, _UNKNOWN
+
+            if params["EPHEM_TYPE"] == "VECTORS":
+                head, row, tail = self.vectors
+                # JDTDB and X
+                idx_jd, idx_val = 0, 2
+            else:
+                head, row, tail = self.ephemerides
+                # Date_________JDUT and R.A._(ICRF)
+                idx_jd, idx_val = 1, 4
+            rows = []
+            for jd in _epochs(params):
+                fields = row.split(",")
+                fields[idx_jd] = f" {jd:.9f}"
+                fields[idx_val] = f" {float(target):.5f}"
+                rows.append(",".join(fields))
+            return 200, head + "\n".join(rows) + "\n" + tail
+        finally:
+            with self.lock:
+                self.active -= 1
+
+
+class _Conf:
+    """Configuration of astroquery with another URL of Horizons."""
+
+    def __init__(self, conf, url):
+        self._conf = conf
+        self.horizons_server = url
+
+    def __getattr__(self, key):
+        return getattr(self._conf, key)
+
+
+@pytest.fixture
+def horizons_stub(monkeypatch):
+    """Run a stub of the Horizons API and point astroquery to it."""
+    from astroquery.jplhorizons import core
+
+    stub = StubHorizons()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            params = {
+                key: val[0] for key, val
+                in parse_qs(urlparse(self.path).query).items()}
+            status, body = stub.respond(params)
+            data = body.encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/horizons.api"
+    monkeypatch.setattr(core, "conf", _Conf(core.conf, url))
+    yield stub
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,142 @@
+import numpy as np
+import pytest
+from matplotlib.colors import to_rgb
+from matplotlib.figure import Figure
+
+from minor_planet_painter.classify import (
+    RULES, RULES_DETAILED, CHUNK, class_names, classify, bin_index,
+    histogram_classes, composite_classes, density_classes)
+
+
+def _masks(a, e):
+    """Count classes with boolean masks as in the first versions of scripts.
+    """
+    q = a*(1 - e)
+    mask_nea = (q < 1.3)
+    mask_mba = (q >= 1.3) & (a >= 1.8) & (a <= 3.3)
+    mask_hilda = (
+        (q >= 1.3) & (a >= 3.7) & (a <= 4.0) & (e >= 0.07) & (e <= 0.3))
+    mask_trojan = (q >= 1.3) & (a >= 5.0) & (a <= 5.4)
+    mask_tno = (q >= 1.3) & (a >= 30.0)
+    masks = [mask_nea, mask_mba, mask_hilda, mask_trojan, mask_tno]
+    counts = [np.sum(mask) for mask in masks]
+    counts.append(len(a) - sum(counts))
+    return np.array(counts)
+
+
+def _catalog(N=3*CHUNK + 100, seed=0):
+    """Random orbits plus ones on the boundaries of the classes."""
+    rng = np.random.default_rng(seed)
+    a = np.concatenate([
+        rng.uniform(0.5, 6., N//2), rng.uniform(6., 60., N - N//2),
+        [1.3, 1.8, 3.3, 3.7, 4.0, 3.8, 3.8, 5.0, 5.4, 30.0, 2.0]])
+    # The first and the last ones have q == 1.3
+    e = np.concatenate([
+        rng.uniform(0., 0.99, N),
+        [0., 0., 0., 0.1, 0.1, 0.07, 0.3, 0., 0., 0., 0.35]])
+    i = rng.uniform(0., 40., len(a))
+    return a, e, i
+
+
+def test_classify_masks():
+    a, e, _ = _catalog()
+    code, counts = classify(a, e)
+    assert np.array_equal(counts, _masks(a, e))
+    assert np.array_equal(
+        np.bincount(code, minlength=len(RULES) + 1), counts)
+    # Boundaries (q == 1.3 is not an NEA)
+    names = class_names()
+    assert [names[c] for c in code[-11:]] == [
+        "Others", "MBA", "MBA", "Hilda", "Hilda", "Hilda", "Hilda",
+        "Trojan", "Trojan", "TNO", "MBA"]
+
+
+def test_classify_hyperbolic():
+    # Aten, Atira, and a hyperbolic orbit with a < 1 and Q < 0.983
+    a = [0.9, 0.7, -2.0]
+    e = [0.2, 0.3, 1.2]
+    i = [5., 5., 5.]
+    code, counts = classify(a, e, i, rules=RULES_DETAILED)
+    names = class_names(RULES_DETAILED)
+    assert [names[c] for c in code] == ["Aten", "Atira", "Others"]
+    assert counts.sum() == 3
+
+
+def test_classify_detailed():
+    # Atira, Aten, Apollo, Amor, Hungaria, MBA, Centaur, TNO
+    a = [0.8, 0.95, 1.5, 1.6, 1.9, 1.9, 10., 40.]
+    e = [0.1, 0.1, 0.5, 0.3, 0.1, 0.1, 0.1, 0.1]
+    i = [5., 5., 5., 5., 20., 5., 5., 5.]
+    code, _, stats = classify(
+        a, e, i, rules=RULES_DETAILED, return_stats=True)
+    names = class_names(RULES_DETAILED)
+    assert [names[c] for c in code] == [
+        "Atira", "Aten", "Apollo", "Amor", "Hungaria", "MBA", "Centaur",
+        "TNO"]
+    assert stats["counts"]["MBA"] == 1 and stats["counts"]["Others"] == 0
+
+    with pytest.raises(ValueError, match="Inclination"):
+        classify(a, e, rules=RULES_DETAILED)
+    with pytest.raises(ValueError, match="Unknown quantity"):
+        classify(a, e, rules=(("X", "X", "red", {"H": (None, 10.)}),))
+
+
+def test_bin_index():
+    edges = np.array([0., 1., 2., 3.])
+    x = [-0.1, 0., 0.5, 1., 2.999, 3., 3.1, np.nan]
+    idx = bin_index(x, edges)
+    assert idx.tolist() == [-1, 0, 0, 1, 2, 2, -1, -1]
+    # Same bins as np.histogram
+    x = np.random.default_rng(1).uniform(-0.5, 3.5, 1000)
+    idx = bin_index(x, edges)
+    assert np.array_equal(
+        np.bincount(idx[idx >= 0], minlength=3), np.histogram(x, edges)[0])
+
+
+def test_histogram_classes_chunks():
+    a, e, _ = _catalog(N=10000)
+    edges = np.linspace(0., 5., 51)
+    hist = None
+    for idx0 in range(0, len(a), 777):
+        sl = slice(idx0, idx0 + 777)
+        code, _ = classify(a[sl], e[sl])
+        hist = histogram_classes(
+            code, bin_index(a[sl], edges), len(edges) - 1, hist=hist)
+
+    code, _ = classify(a, e)
+    assert hist.shape == (len(RULES) + 1, len(edges) - 1)
+    for n in range(len(RULES) + 1):
+        assert np.array_equal(hist[n], np.histogram(a[code == n], edges)[0])
+
+
+def test_composite_classes():
+    N_cls = len(RULES) + 1
+    hist = np.zeros((N_cls, 2, 3), dtype=np.int64)
+    # One NEA, two NEAs, an NEA over an MBA, and an MBA of an empty class
+    hist[0, 0, 0] = 1
+    hist[0, 0, 1] = 2
+    hist[0, 0, 2] = 1
+    hist[1, 0, 2] = 1
+    hist[2, 1, 0] = 1
+    counts = np.array([4, 1, 0, 0, 0, 0])
+    img = composite_classes(hist, counts, alpha=0.9)
+    assert img.shape == (2, 3, 4)
+    assert np.allclose(img[0, :, 3], [0.9, 0.99, 0.99])
+    assert np.all(img[1, :, 3] == 0)
+    assert np.allclose(img[0, 0, :3], to_rgb("red"))
+    # The NEA (higher priority) is on top of the MBA
+    rgb = (np.array(to_rgb("red"))*0.9
+           + np.array(to_rgb("green"))*0.9*0.1)/0.99
+    assert np.allclose(img[0, 2, :3], rgb)
+
+
+def test_density_classes():
+    a, e, _ = _catalog(N=1000)
+    code, counts = classify(a, e)
+    fig = Figure(figsize=(2, 2), dpi=50)
+    ax = fig.add_axes([0., 0., 1., 1.])
+    density_classes(ax, a, e, code, counts, extent=(0., 6., 0., 1.))
+    img = ax.images[0].get_array()
+    assert img.shape == (100, 100, 4)
+    assert 0 < np.count_nonzero(img[..., 3]) <= 1000
+    assert np.max(img[..., 3]) <= 1
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from astropy.time import Time
+
+from minor_planet_painter.common import (
+    utc2jd, solve_kepler_eq, mpcepoch2jd, mpcepoch2jd_array)
+
+
+def test_utc2jd_int_is_jd():
+    assert utc2jd(2460000) == 2460000.0
+    assert utc2jd(np.int64(2460000)) == 2460000.0
+    jd = utc2jd(np.array([2460000, 2460001]))
+    assert jd.dtype == np.float64
+    assert np.array_equal(jd, [2460000., 2460001.])
+
+
+def test_utc2jd_str():
+    assert utc2jd("2023-02-24T12:00:00") == 2460000.0
+
+
+def test_solve_kepler_eq_signature():
+    M = np.linspace(-3., 3., 7)
+    # The third positional argument is max_iter as before
+    _, stats = solve_kepler_eq(M, 0.5, 2, return_stats=True)
+    assert stats["N_iter"] == 2
+    with pytest.raises(TypeError):
+        solve_kepler_eq(M, 0.5, 50, 1e-12)
+
+
+def test_solve_kepler_eq_residual():
+    rng = np.random.default_rng(0)
+    # Several revolutions and eccentricities up to nearly parabolic
+    M = rng.uniform(-20., 20., 10000)
+    e = np.concatenate([rng.uniform(0., 0.99, 9990), np.full(10, 0.99999)])
+    M[-10:] = np.linspace(-1e-3, 1e-3, 10)
+    E, stats = solve_kepler_eq(M, e, return_stats=True)
+    assert np.max(np.abs(E - e*np.sin(E) - M)) < 1e-13
+    assert stats["N"] == len(M)
+    assert stats["N_unconverged"] == 0
+    assert stats["hist_iter"].sum() == len(M)
+    assert len(M) <= stats["N_eval"] <= stats["N_iter"]*len(M)
+
+    # Looser tolerance, fewer updates
+    _, stats_loose = solve_kepler_eq(M, e, tol=1e-4, return_stats=True)
+    assert stats_loose["N_eval"] < stats["N_eval"]
+    assert isinstance(solve_kepler_eq(1., 0.5), float)
+
+
+def test_mpcepoch2jd():
+    # Month (1-9, A-C) and day (1-9, A-V) in packed dates
+    epochs = {
+        "K24AH": "2024-10-17", "J9611": "1996-01-01", "K2531": "2025-03-01",
+        "K255V": "2025-05-31", "J9912": "1999-01-02", "K24CA": "2024-12-10"}
+    ref = Time(list(epochs.values()), scale="utc").jd
+    jd = [mpcepoch2jd(code) for code in epochs]
+    assert np.allclose(jd, ref, rtol=0, atol=1e-8)
+    jd = mpcepoch2jd_array(np.array(list(epochs)*3))
+    assert np.allclose(jd, np.tile(ref, 3), rtol=0, atol=1e-8)
+    with pytest.raises(ValueError):
+        mpcepoch2jd_array(["K24AW"])
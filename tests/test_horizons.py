@@ -0,0 +1,183 @@
+import time
+import sqlite3
+import threading
+import numpy as np
+import pytest
+
+from minor_planet_painter import horizons
+from minor_planet_painter.common import get_planet_positions, get_planet_orbits
+from minor_planet_painter.horizons import (
+    VECTOR_COLUMNS, query_vectors, query_vectors_many)
+
+
+def test_query_vectors_many_concurrent(horizons_stub, tmp_path):
+    horizons_stub.delay = 0.3
+    epochs = [2460912.5, 2460913.5, 2460914.5]
+    queries = [(pid, "@0", epochs) for pid in range(1, 9)]
+
+    t0 = time.perf_counter()
+    vecs = query_vectors_many(queries, workers=8, db=tmp_path/"h.sqlite")
+    t_elapse = time.perf_counter() - t0
+
+    # Sent at once, not one after another (8 x 0.3 s)
+    assert horizons_stub.max_active > 1
+    assert t_elapse < 1.5
+    # One dict of VECTOR_COLUMNS per query in the order of queries
+    assert len(vecs) == len(queries)
+    for (pid, _, _), vec in zip(queries, vecs):
+        assert set(vec) == set(VECTOR_COLUMNS)
+        assert np.array_equal(vec["datetime_jd"], epochs)
+        assert np.all(vec["x"] == pid)
+
+
+def test_get_planet_positions_and_orbits(horizons_stub):
+    positions = get_planet_positions("2025-08-25T00:00:00", cache=False)
+    assert list(positions)[:3] == ["Mercury", "Venus", "Earth"]
+    for pid, (name, pos) in enumerate(positions.items(), 1):
+        assert len(pos) == 3
+        assert pos[0] == pid
+
+    orbits = get_planet_orbits("2025-08-25T00:00:00", cache=False)
+    assert len(orbits) == 9
+    x, y = orbits["Mercury"]
+    # 120 days with a step of 1 day
+    assert len(x) == len(y) == 121
+    assert np.all(x == 1)
+    assert np.all(orbits["Neptune"][0] == 8)
+
+
+def test_retry_transient_failure(horizons_stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(horizons, "BACKOFF", 0.01)
+    horizons_stub.fail["5"] = 1
+    vec = query_vectors(
+        5, "@0", [2460912.5], cache=False, db=tmp_path/"h.sqlite")
+    assert vec["x"][0] == 5
+    # HTTP 503 once, then success
+    assert horizons_stub.requests == ["5", "5"]
+
+
+def test_no_retry_permanent_failure(horizons_stub, tmp_path):
+    t0 = time.perf_counter()
+    with pytest.raises(ValueError, match="Unknown target"):
+        horizons.query_ephemeris(
+            "bad1", "500", [2460912.5], db=tmp_path/"h.sqlite")
+    assert horizons_stub.requests == ["bad1"]
+    assert time.perf_counter() - t0 < horizons.BACKOFF
+
+
+def _count(db, pinned=None):
+    con = sqlite3.connect(db)
+    sql = "SELECT COUNT(*) FROM queries"
+    if pinned is not None:
+        sql += f" WHERE pinned = {int(pinned)}"
+    N = con.execute(sql).fetchone()[0]
+    con.close()
+    return N
+
+
+def test_query_ephemerides_batches(horizons_stub, tmp_path, capsys):
+    ids = [str(n) for n in range(1, 8)]
+    ephs = horizons.query_ephemerides(
+        ids, "500", [2460912.5], workers=3, batch=3, db=tmp_path/"h.sqlite")
+    out = capsys.readouterr().out
+    assert "3/7 queried" in out and "6/7 queried" in out
+    assert "7/7 queried" in out
+    assert [float(eph["RA"][0]) for eph in ephs] == list(range(1, 8))
+    assert all(set(eph) == set(horizons.EPHEM_COLUMNS) for eph in ephs)
+
+
+def test_query_ephemerides_failure(horizons_stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(horizons, "BACKOFF", 0.01)
+    # Unknown target and a target failing more than RETRIES times
+    horizons_stub.fail["3"] = horizons.RETRIES + 1
+    ids = ["1", "bad2", "3", "4"]
+    ephs = horizons.query_ephemerides(
+        ids, "500", [2460912.5], db=tmp_path/"h.sqlite")
+    assert [eph is None for eph in ephs] == [False, True, True, False]
+    # Failed targets become NaN as in plot_sssb_skymotion.py
+    vel = np.array([
+        np.hypot(eph["RA_rate"][0], eph["DEC_rate"][0])
+        if eph is not None else np.nan for eph in ephs])
+    assert np.array_equal(np.isnan(vel), [False, True, True, False])
+
+
+def test_query_ephemerides_resume(horizons_stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(horizons, "BACKOFF", 0.01)
+    db = tmp_path/"h.sqlite"
+    ids = [str(n) for n in range(1, 11)]
+    horizons_stub.fail["7"] = horizons.RETRIES + 1
+    # The cache is much smaller than the results, but finished queries
+    # are kept as the checkpoint of the unfinished run
+    ephs = horizons.query_ephemerides(
+        ids, "500", [2460912.5], max_bytes=1, db=db)
+    assert sum(eph is None for eph in ephs) == 1
+    assert _count(db, pinned=True) == 9
+
+    # Rerun queries only the missing target
+    horizons_stub.requests.clear()
+    ephs = horizons.query_ephemerides(
+        ids, "500", [2460912.5], max_bytes=1, db=db)
+    assert horizons_stub.requests == ["7"]
+    assert all(eph is not None for eph in ephs)
+    # The finished run releases its checkpoint to the LRU eviction
+    assert _count(db, pinned=True) == 0
+    assert _count(db) == 0
+
+
+def test_evict_lru_and_pinned(tmp_path):
+    db = tmp_path/"h.sqlite"
+    res = {"x": np.zeros(100)}
+    size = len(horizons._encode(res))
+    kw = dict(cache=True, ttl=None, max_bytes=int(3.5*size), db=db)
+    horizons._query(
+        "vectors", lambda *a: res, "seed", "@0", 0., pin=True, **kw)
+    for n in range(5):
+        horizons._query(
+            "vectors", lambda *a: res, str(n), "@0", 0., pin=False, **kw)
+    # Pinned entry and the 3 most recent ones (within EVICT_TO)
+    assert _count(db, pinned=True) == 1
+    assert _count(db, pinned=False) == 3
+    con = sqlite3.connect(db)
+    keys = [row[0] for row in con.execute("SELECT key FROM queries")]
+    total = con.execute("SELECT value FROM stats").fetchone()[0]
+    con.close()
+    assert horizons.cache_key("0", "@0", 0.) not in keys
+    assert total == 3*size
+
+
+def test_query_vectors_many_split_epochs(horizons_stub, tmp_path):
+    epochs = list(2460912.5 + np.arange(120.))
+    vecs = query_vectors_many(
+        [(1, "@0", epochs), (2, "@0", epochs[:3])], max_epochs=50,
+        db=tmp_path/"h.sqlite")
+    # 50 + 50 + 20 epochs of the first query and the short one
+    assert sorted(horizons_stub.requests) == ["1", "1", "1", "2"]
+    assert np.array_equal(vecs[0]["datetime_jd"], epochs)
+    assert np.all(vecs[0]["x"] == 1)
+    assert np.array_equal(vecs[1]["datetime_jd"], epochs[:3])
+
+
+def test_connect_concurrent(tmp_path):
+    # Threads opening a fresh database at once (e.g., query_vectors_many)
+    for trial in range(10):
+        db = tmp_path/f"h{trial}.sqlite"
+        barrier = threading.Barrier(16)
+        errors = []
+
+        def open_db():
+            barrier.wait()
+            try:
+                with horizons._connect(db):
+                    pass
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=open_db) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert errors == []
+        con = sqlite3.connect(db)
+        assert con.execute("SELECT * FROM stats").fetchall() == [("bytes", 0)]
+        con.close()
@@ -0,0 +1,145 @@
+import os
+import json
+import numpy as np
+import pytest
+
+from minor_planet_painter import mpcorb
+from minor_planet_painter.classify import RULES, CLASSES
+
+
+def _record(n, a=None, e=0.0794013):
+    """Return a record of MPCORB.DAT with the mean anomaly n/1000."""
+    if a is None:
+        a = 0.5 + n/1000
+    line = [" "]*202
+    fields = {
+        "desig": f"{n:05d}", "H": f"{10 + n % 7:5.2f}", "G": " 0.15",
+        "epoch": "K2555", "M": f"{n/1000:9.5f}", "omega": f"{73.27343:9.5f}",
+        "Omega": f"{80.25221:9.5f}", "i": f"{10.5878:9.5f}",
+        "e": f"{e:9.7f}", "n": f"{0.21424651:11.8f}",
+        "a": f"{a:11.7f}", "name": f"({n}) Test"}
+    for key, val in fields.items():
+        start, stop = mpcorb.COLUMNS[key]
+        line[start:stop] = val.ljust(stop - start)[:stop - start]
+    return "".join(line)
+
+
+def _write(fi, N, extra=()):
+    """Write a synthetic MPCORB.DAT with a header and N (+ extra) records."""
+    header = ["MINOR PLANET CENTER ORBIT DATABASE (MPCORB)", ""]*20
+    with open(fi, "w") as f:
+        f.write("\n".join(header + ["-"*160]
+                          + [_record(n) for n in range(N)] + list(extra))
+                + "\n")
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """Keep the cache under tmp_path."""
+    d = tmp_path/"cache"
+    monkeypatch.setattr(mpcorb, "CACHE", str(d))
+    return d
+
+
+def test_iter_chunks_sizes(tmp_path):
+    fi = tmp_path/"MPCORB.DAT"
+    _write(fi, 7000)
+
+    chunks = list(mpcorb.iter_chunks(fi, ["M", "a"], chunk=3000, cache=False))
+    assert [len(cat["M"]) for cat in chunks] == [3000, 3000, 1000]
+    cat = mpcorb.load(fi, ["M", "a"], cache=False)
+    for key in cat:
+        assert np.array_equal(
+            np.concatenate([sub[key] for sub in chunks]), cat[key])
+
+    # Filters (inclusive ranges) are applied per chunk
+    where = {"a": (None, 1.5)}
+    chunks = list(mpcorb.iter_chunks(
+        fi, ["M"], chunk=3000, cache=False, where=where))
+    assert np.array_equal(
+        np.concatenate([sub["M"] for sub in chunks]),
+        np.arange(1001)/1000)
+
+
+def test_header_only(tmp_path, cache):
+    fi = tmp_path/"MPCORB.DAT"
+    _write(fi, 0)
+    for cache in (False, True, True):
+        cat = mpcorb.load(fi, cache=cache)
+        assert set(cat) == set(mpcorb.COLUMNS)
+        assert all(len(val) == 0 for val in cat.values())
+    assert list(mpcorb.iter_chunks(fi, cache=False)) == []
+    assert list(mpcorb.iter_chunks(fi)) == []
+
+
+def _equal(cat, ref):
+    assert list(cat) == list(ref)
+    for key in ref:
+        assert cat[key].dtype == ref[key].dtype
+        assert np.array_equal(cat[key], ref[key])
+
+
+def test_cache(tmp_path, cache):
+    fi = tmp_path/"MPCORB.DAT"
+    _write(fi, 100)
+    ref = mpcorb.load(fi, cache=False)
+    # Bypassed with cache=False
+    assert not os.path.exists(mpcorb.cache_dir(fi))
+    assert len(ref["M"]) == 100
+
+    # Parsed and saved, then reopened as memory maps
+    _equal(mpcorb.load(fi), ref)
+    assert os.path.exists(os.path.join(mpcorb.cache_dir(fi), "M.npy"))
+    cat = mpcorb.load(fi)
+    assert isinstance(cat["M"], np.memmap)
+    _equal(cat, ref)
+
+
+def test_cache_rebuild(tmp_path, cache):
+    fi = tmp_path/"MPCORB.DAT"
+    _write(fi, 100)
+    mpcorb.load(fi, ["M"])
+
+    # Size changed
+    _write(fi, 120)
+    assert len(mpcorb.load(fi, ["M"])["M"]) == 120
+
+    # Same size and content, only mtime changed
+    st = os.stat(fi)
+    os.utime(fi, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    mpcorb.load(fi, ["M"])
+    with open(os.path.join(mpcorb.cache_dir(fi), "meta.json")) as f:
+        meta = json.load(f)
+    assert meta["source"]["mtime_ns"] == st.st_mtime_ns + 10**9
+
+    # Same size, content changed
+    with open(fi, "r+b") as f:
+        f.seek(-len(_record(119)) - 1, os.SEEK_END)
+        f.write(_record(999).encode())
+    M = mpcorb.load(fi, ["M"])["M"]
+    assert len(M) == 120 and M[-1] == 0.999
+
+
+def test_where(tmp_path, cache):
+    fi = tmp_path/"MPCORB.DAT"
+    # q == 1.3 exactly at the boundary of NEAs
+    _write(fi, 100, extra=[_record(100, a=1.3, e=0.)])
+    where = {"desig": ["00003", "00010"], "name": ["(10) Test", "(50) Test"]}
+    for use_cache in (False, True, True):
+        cat = mpcorb.load(fi, ["M"], cache=use_cache, where=where)
+        assert np.array_equal(cat["M"], [0.01])
+
+        cat = mpcorb.load(
+            fi, ["a", "e"], cache=use_cache, where={"q": (1.25, 1.3)})
+        assert np.array_equal(cat["a"], [1.3])
+
+        # The NEA rule (q < 1.3) excludes the boundary
+        where_nea = RULES[CLASSES.index("NEA")][3]
+        cat = mpcorb.load(fi, ["desig"], cache=use_cache, where=where_nea)
+        assert len(cat["desig"]) == 100
+        assert "00100" not in cat["desig"]
+
+        # First Nobj records satisfying the filters
+        cat = mpcorb.load(
+            fi, ["M"], Nobj=5, cache=use_cache, where={"a": (0.55, None)})
+        assert np.array_equal(cat["M"], [0.05, 0.051, 0.052, 0.053, 0.054])
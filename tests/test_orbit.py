@@ -0,0 +1,107 @@
+import numpy as np
+
+from minor_planet_painter.common import mpcepoch2jd_array, solve_kepler_eq
+from minor_planet_painter.orbit import (
+    anomaly, prepare, propagate, propagate_epochs, solve_barker_eq,
+    solve_kepler_eq_hyp)
+
+
+def _catalog():
+    """Elliptic, parabolic and hyperbolic orbits with q and epoch_jd."""
+    rng = np.random.default_rng(1)
+    e = np.concatenate([rng.uniform(0., 0.95, 20), [1., 1.], [1.2, 3.]])
+    N = len(e)
+    return dict(
+        e=e, q=rng.uniform(0.3, 5., N), M=rng.uniform(-180., 180., N),
+        omega=rng.uniform(0., 360., N), Omega=rng.uniform(0., 360., N),
+        i=rng.uniform(0., 180., N), epoch_jd=np.full(N, 2460800.5))
+
+
+def test_solve_kepler_eq_hyp_residual():
+    rng = np.random.default_rng(0)
+    M = rng.uniform(-50., 50., 1000)
+    e = rng.uniform(1.0001, 5., 1000)
+    H = solve_kepler_eq_hyp(M, e)
+    assert np.all(np.abs(e*np.sinh(H) - H - M) < 1e-12*(1 + np.abs(M)))
+
+
+def test_solve_barker_eq_residual():
+    M = np.concatenate([-np.logspace(-6, 6, 50), np.logspace(-6, 6, 50)])
+    D = solve_barker_eq(M)
+    # Absolute for small M (B - 1/B cancels)
+    assert np.all(np.abs(D + D**3/3 - M) < 1e-14*np.maximum(np.abs(M), 1))
+
+
+def test_anomaly_mixed_e():
+    cat = _catalog()
+    M = np.deg2rad(cat["M"])
+    nu, r = anomaly(M, cat["e"], cat["q"])
+    assert not np.any(np.isnan(nu))
+    # Conic equation with the semi-latus rectum q*(1 + e)
+    p = cat["q"]*(1 + cat["e"])
+    assert np.allclose(r, p/(1 + cat["e"]*np.cos(nu)), rtol=1e-12)
+    # Elliptic orbits as solved alone
+    idx = cat["e"] < 1
+    E = solve_kepler_eq(M[idx], cat["e"][idx])
+    assert np.allclose(
+        r[idx], cat["q"][idx]/(1 - cat["e"][idx])
+        * (1 - cat["e"][idx]*np.cos(E)), rtol=1e-12)
+
+
+def test_propagate_baseline():
+    # Elements as in MPCORB.DAT
+    rng = np.random.default_rng(2)
+    N = 100
+    cat = dict(
+        a=rng.uniform(0.5, 40., N), e=rng.uniform(0., 0.9, N),
+        i=rng.uniform(0., 60., N), M=rng.uniform(0., 360., N),
+        omega=rng.uniform(0., 360., N), Omega=rng.uniform(0., 360., N),
+        epoch=np.array(["K2555", "K24AH"]*(N//2)))
+    cat["n"] = np.rad2deg(0.01720209895/cat["a"]**1.5)
+    jd = 2461000.5
+    x, y, z = propagate(prepare(cat), jd)
+
+    # Formulas of the first version of plot_sssb_xy.py
+    M, omega, Omega, i = [
+        np.deg2rad(cat[key]) for key in ("M", "omega", "Omega", "i")]
+    a, e = cat["a"], cat["e"]
+    M_t = M + np.deg2rad(cat["n"])*(jd - mpcepoch2jd_array(cat["epoch"]))
+    E = solve_kepler_eq(M_t, e)
+    nu = 2*np.arctan2(np.sqrt(1+e)*np.sin(E/2), np.sqrt(1-e)*np.cos(E/2))
+    nu_total = np.mod(omega + nu, 2*np.pi)
+    r = a*(1 - e*np.cos(E))
+    x_ref = r*(np.cos(Omega)*np.cos(nu_total)
+               - np.sin(Omega)*np.sin(nu_total)*np.cos(i))
+    y_ref = r*(np.sin(Omega)*np.cos(nu_total)
+               + np.cos(Omega)*np.sin(nu_total)*np.cos(i))
+    z_ref = r*np.sin(nu_total)*np.sin(i)
+    for val, ref in zip((x, y, z), (x_ref, y_ref, z_ref)):
+        assert np.allclose(val, ref, rtol=0, atol=1e-12*np.max(a))
+
+
+def test_propagate_velocity():
+    orb = prepare(_catalog())
+    jd, h = 2460900.5, 1e-3
+    x, y, z, vx, vy, vz = propagate(orb, jd, velocity=True)
+    pos_p = propagate(orb, jd + h)
+    pos_m = propagate(orb, jd - h)
+    for v, p, m in zip((vx, vy, vz), pos_p, pos_m):
+        assert np.allclose(v, (p - m)/(2*h), rtol=1e-6, atol=1e-10)
+
+
+def test_propagate_epochs_chunks():
+    orb = prepare(_catalog())
+    jds = 2460800.5 + np.arange(7.)*30
+    ref = propagate(orb, jds[:, None], velocity=True)
+    # Budgets splitting objects, and epochs only
+    for memory in (250*5, 250*len(orb["e"])*3):
+        res = [np.full(ref[0].shape, np.nan) for _ in range(6)]
+        N_chunk = 0
+        for sl_t, sl_obj, *vals in propagate_epochs(
+                orb, jds, velocity=True, memory=memory):
+            N_chunk += 1
+            for arr, val in zip(res, vals):
+                arr[sl_t, sl_obj] = val
+        assert N_chunk > 1
+        for arr, val in zip(res, ref):
+            assert np.array_equal(arr, val)
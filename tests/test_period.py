@@ -0,0 +1,84 @@
+import numpy as np
+
+from minor_planet_painter.period import (
+    best_period, find_period, lomb_scargle, pdm, periodogram, string_length)
+
+
+P = 0.2871
+## Width of periodogram peaks of the lightcurves (baseline of ~10 days)
+WIDTH = P**2/10.
+
+
+def _lightcurve(double_peaked=False, seed=0):
+    """Unevenly sampled lightcurve with noise in a few nights."""
+    rng = np.random.default_rng(seed)
+    t = np.concatenate([
+        night + np.sort(rng.uniform(0., 0.3, 60))
+        for night in (0., 1.02, 3.05, 6.1, 9.97)])
+    phase = 2*np.pi*t/P
+    if double_peaked:
+        y = 1 + 0.2*np.cos(2*phase) + 0.01*np.cos(phase + 0.5)
+    else:
+        y = 1 + 0.2*np.cos(phase)
+    y += rng.normal(0., 0.01, len(t))
+    return t, y
+
+
+def _string_length_loop(t, y, periods):
+    stat = []
+    for p in periods:
+        ys = y[np.argsort(np.mod(t/p, 1.))]
+        stat.append(np.sum(np.diff(ys)**2))
+    return np.array(stat)
+
+
+def test_string_length():
+    t, y = _lightcurve()
+    ps = np.linspace(0.99*P, 1.01*P, 2001)
+    stat = string_length(t, y, ps)
+    assert np.allclose(stat, _string_length_loop(t, y, ps))
+    assert abs(ps[np.argmin(stat)] - P) < 0.05*WIDTH
+
+
+def test_pdm():
+    t, y = _lightcurve()
+    ps = np.linspace(0.99*P, 1.01*P, 2001)
+    stat = pdm(t, y, ps)
+    assert abs(ps[np.argmin(stat)] - P) < 0.05*WIDTH
+    # Pooled variance of the noise against that of the lightcurve
+    assert np.min(stat) < 0.1
+    assert np.median(pdm(t, y, np.linspace(0.5*P, 0.8*P, 100))) > 0.5
+
+
+def test_periodogram_blocks():
+    t, y = _lightcurve()
+    ps = np.linspace(0.9*P, 1.1*P, 500)
+    for method in ("string", "pdm"):
+        ref = periodogram(t, y, ps, method=method)
+        # Small blocks in processes
+        stat = periodogram(
+            t, y, ps, method=method, memory=50*len(t)*64, Nproc=2)
+        assert np.array_equal(stat, ref)
+
+
+def test_lomb_scargle():
+    t, y = _lightcurve()
+    periods, power = lomb_scargle(t, y, 0.05, 2., nterms=1)
+    assert np.all(np.diff(periods) > 0)
+    assert abs(best_period(periods, power) - P) < 0.1*WIDTH
+
+
+def test_best_period_double_peaked():
+    t, y = _lightcurve(double_peaked=True)
+    periods, power = lomb_scargle(t, y, 0.05, 2., nterms=2)
+    # The peak at P/2 is as high as the one at P
+    assert abs(best_period(periods, power) - P/2) < 0.1*WIDTH
+    assert abs(
+        best_period(periods, power, double_peaked=True) - P) < 0.1*WIDTH
+
+
+def test_find_period():
+    t, y = _lightcurve(double_peaked=True)
+    for method in ("string", "pdm"):
+        P_found = find_period(t, y, 0.05, 2., method=method, Nrefine=2000)
+        assert abs(P_found - P) < 0.05*WIDTH
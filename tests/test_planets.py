@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from minor_planet_painter.planets import planet_positions
+
+
+## Tolerance in au, i.e., the accuracy in planets.py with a margin of
+## ~1.3-5. Pluto is not tested, since ERFA has no theory of Pluto.
+TOL = {
+    "Mercury": 1e-4, "Venus": 2e-4, "Earth": 2e-4, "Mars": 5e-4,
+    "Jupiter": 0.012, "Saturn": 0.035, "Uranus": 0.012, "Neptune": 0.012}
+
+## Heliocentric ecliptic J2000 positions in au at jd (TDB). Fixed offline
+## references from ERFA (IAU SOFA plan94 for planets, epv00 for the
+## Earth), which agree with the JPL DE ephemerides within arcseconds.
+REFERENCE = {
+    # 2000-01-01T12:00
+    2451545.0: {
+        "Mercury": (-0.130092, -0.447287, -0.024598),
+        "Venus": (-0.718302, -0.032656, 0.041015),
+        "Earth": (-0.177135, 0.967242, -0.000004),
+        "Mars": (1.390705, -0.013374, -0.034462),
+        "Jupiter": (4.001560, 2.938111, -0.101663),
+        "Saturn": (6.404602, 6.570420, -0.369610),
+        "Uranus": (14.432060, -13.735115, -0.238305),
+        "Neptune": (16.812025, -24.991678, 0.127205),
+    },
+    # 2010-01-01
+    2455197.5: {
+        "Mercury": (0.050903, 0.302674, 0.020058),
+        "Venus": (0.053346, -0.725164, -0.013009),
+        "Earth": (-0.176018, 0.967421, -0.000022),
+        "Mars": (-0.729569, 1.454314, 0.048387),
+        "Jupiter": (4.509019, -2.166108, -0.091890),
+        "Saturn": (-9.464848, 0.259105, 0.372402),
+        "Uranus": (20.035514, -1.533948, -0.265579),
+        "Neptune": (24.817816, -16.897161, -0.223945),
+    },
+    # 2025-08-25
+    2460912.5: {
+        "Mercury": (0.147365, 0.272022, 0.008714),
+        "Venus": (0.255274, 0.674286, -0.005467),
+        "Earth": (0.890149, -0.479051, 0.000024),
+        "Mars": (-1.302715, -0.906950, 0.012939),
+        "Jupiter": (-0.736854, 5.112060, -0.004729),
+        "Saturn": (9.539863, -0.460868, -0.372061),
+        "Uranus": (10.318990, 16.559734, -0.072336),
+        "Neptune": (29.880559, 0.112002, -0.690851),
+    },
+    # 2040-05-01
+    2466154.5: {
+        "Mercury": (0.016377, -0.460808, -0.039169),
+        "Venus": (-0.710746, -0.112411, 0.039454),
+        "Earth": (-0.164118, 0.969520, -0.000088),
+        "Mars": (-0.290329, 1.567149, 0.039962),
+        "Jupiter": (-5.354423, 0.887139, 0.116000),
+        "Saturn": (-9.496577, -0.860334, 0.393475),
+        "Uranus": (-9.448949, 16.013497, 0.181882),
+        "Neptune": (25.255917, 15.813928, -0.907612),
+    },
+}
+
+
+@pytest.mark.parametrize("jd", list(REFERENCE))
+def test_planet_positions(jd):
+    pos = planet_positions(np.array([jd]), names=list(TOL))
+    for name, ref in REFERENCE[jd].items():
+        d = np.linalg.norm(np.ravel(pos[name]) - np.array(ref))
+        assert d < TOL[name], f"{name}: {d:.6f} au"
@@ -0,0 +1,135 @@
+import numpy as np
+
+from minor_planet_painter.orbit import prepare, propagate
+from minor_planet_painter.sky import (
+    R_EARTH_AU, distance, earth_state, observatory_state,
+    pab_rate, sky_rates, synodic_offset)
+
+
+JD = 2460912.5
+
+
+def _elements():
+    """Main-belt asteroids and near-Earth asteroids."""
+    rng = np.random.default_rng(3)
+    N = 20
+    return prepare(dict(
+        q=np.concatenate([rng.uniform(1.8, 3., N//2),
+                          rng.uniform(0.8, 1.2, N//2)]),
+        e=rng.uniform(0.05, 0.6, N), i=rng.uniform(0., 40., N),
+        M=rng.uniform(0., 360., N), omega=rng.uniform(0., 360., N),
+        Omega=rng.uniform(0., 360., N), epoch_jd=np.full(N, JD)))
+
+
+def test_sky_rates_finite_difference():
+    orb = _elements()
+    h = 1e-3
+    for obscode in ("500", "568"):
+        sky = sky_rates(orb, JD, obscode)
+        sky_p = sky_rates(orb, JD + h, obscode)
+        sky_m = sky_rates(orb, JD - h, obscode)
+        # deg/day to arcsec/h
+        conv = 3600./24.
+        dra = np.mod(sky_p["RA"] - sky_m["RA"] + 180., 360.) - 180.
+        ra_rate = dra/(2*h)*np.cos(np.deg2rad(sky["DEC"]))*conv
+        dec_rate = (sky_p["DEC"] - sky_m["DEC"])/(2*h)*conv
+        # The light time changes with the distance (~1e-4 relative)
+        scale = np.hypot(sky["RA_rate"], sky["DEC_rate"])
+        assert np.all(np.abs(sky["RA_rate"] - ra_rate) < 1e-3*scale)
+        assert np.all(np.abs(sky["DEC_rate"] - dec_rate) < 1e-3*scale)
+
+
+def test_topocentric_parallax():
+    orb = _elements()
+    geo = sky_rates(orb, JD, "500")
+    topo = sky_rates(orb, JD, "381")
+    pos_obs, _ = observatory_state(JD, "381")
+    assert 0.9*R_EARTH_AU < np.linalg.norm(pos_obs) < R_EARTH_AU
+
+    # Directions from the geocenter
+    ra, dec = np.deg2rad(geo["RA"]), np.deg2rad(geo["DEC"])
+    d_hat = np.array(
+        [np.cos(dec)*np.cos(ra), np.cos(dec)*np.sin(ra), np.sin(dec)])
+    # Shifts of the direction and the distance by the observatory
+    parallax = np.linalg.norm(
+        np.cross(pos_obs[:, None], d_hat, axis=0), axis=0)/geo["delta"]
+    ra1, dec1 = np.deg2rad(topo["RA"]), np.deg2rad(topo["DEC"])
+    sep = np.arccos(np.clip(
+        np.sin(dec)*np.sin(dec1)
+        + np.cos(dec)*np.cos(dec1)*np.cos(ra1 - ra), -1, 1))
+    assert np.allclose(sep, parallax, rtol=1e-3)
+    d_delta = -pos_obs @ d_hat
+    # Up to R^2/delta
+    assert np.allclose(topo["delta"] - geo["delta"], d_delta, atol=1e-8)
+    assert np.allclose(
+        distance(orb, JD, "381") - distance(orb, JD, "500"), d_delta,
+        atol=1e-8)
+
+
+def _pab_lon(orb, jd, pole):
+    """Longitude of the PAB around the poles from positions."""
+    r = np.array(propagate(orb, jd))
+    pos_earth, _ = earth_state(jd)
+    u = (-r/np.linalg.norm(r, axis=0)
+         + (pos_earth[:, None] - r)/np.linalg.norm(
+             pos_earth[:, None] - r, axis=0))
+    # Basis perpendicular to the poles
+    e1 = np.cross(pole, [[0.], [0.], [1.]], axis=0)
+    e1 /= np.linalg.norm(e1, axis=0)
+    e2 = np.cross(pole, e1, axis=0)
+    return np.arctan2(np.sum(u*e2, axis=0), np.sum(u*e1, axis=0))
+
+
+def test_pab_rate_finite_difference():
+    orb = _elements()
+    N = len(orb["e"])
+    rng = np.random.default_rng(4)
+    lon = rng.uniform(0., 2*np.pi, N)
+    lat = rng.uniform(-1.4, 1.4, N)
+    pole = np.array([np.cos(lat)*np.cos(lon), np.cos(lat)*np.sin(lon),
+                     np.sin(lat)])
+    h = 1e-3
+    rate = pab_rate(orb, JD, pole)
+    dlon = _pab_lon(orb, JD + h, pole) - _pab_lon(orb, JD - h, pole)
+    rate_fd = np.mod(dlon + np.pi, 2*np.pi) - np.pi
+    rate_fd /= 2*h
+    assert np.allclose(rate, rate_fd, rtol=1e-5, atol=1e-8)
+
+
+def test_synodic_offset_relation():
+    # Circular orbits in the ecliptic and the pole perpendicular to it,
+    # as in plot_sssb_Psid_Psyn.py
+    k = 0.01720209895
+    a_E, a_A = 1.0, 2.5
+    n_E, n_A = k/a_E**1.5, k/a_A**1.5
+    theta_E0, theta_A0 = 0.3, 1.0
+    orb = prepare(dict(
+        q=[a_A], e=[0.], i=[0.], omega=[0.], Omega=[0.],
+        M=[np.rad2deg(theta_A0)], epoch_jd=[JD]))
+    jds = JD + np.linspace(0., 30., 31)
+    earth = []
+    for jd in jds:
+        theta = theta_E0 + n_E*(jd - JD)
+        earth.append((
+            a_E*np.array([np.cos(theta), np.sin(theta), 0.]),
+            a_E*n_E*np.array([-np.sin(theta), np.cos(theta), 0.])))
+    P_sid = 0.3
+    dP = synodic_offset(orb, jds, 0., 90., [P_sid], earth=earth)
+
+    def angles(t):
+        theta_E = theta_E0 + n_E*(t - JD)
+        theta_A = theta_A0 + n_A*(t - JD)
+        # Line of sight (alpha in the script) and the direction to the Sun
+        alpha = np.arctan2(a_E*np.sin(theta_E) - a_A*np.sin(theta_A),
+                           a_E*np.cos(theta_E) - a_A*np.cos(theta_A))
+        return alpha, theta_A + np.pi
+
+    # The PAB bisects the two directions, so that its rate is the mean
+    # of their rates
+    h = 1e-3
+    (alpha_p, sun_p), (alpha_m, sun_m) = angles(jds + h), angles(jds - h)
+    rate = ((alpha_p - alpha_m) + (sun_p - sun_m))/(2*2*h)
+    # 1/P_syn = 1/P_sid - (d angle/dt)/(2 pi)
+    P_syn = 1/(1/P_sid - np.mean(rate)/(2*np.pi))
+    assert np.allclose(dP, P_syn - P_sid, rtol=1e-6)
+    assert abs(dP[0]) > 1e-6